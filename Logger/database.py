@@ -3,6 +3,9 @@ from pySql import *
 class Execute(ExecuteSql):
     def __init__(self, title, db=None, printText=True, debug=False):
         ExecuteSql.__init__(self, title, db, printText, debug, accessType=AccessSql.PY_ACCESS)
+        self.setIdStrategy(ExecuteSql.AUTO_INCREMENT_IDS)
+        self.setStaticStatements(True)
+        self.setMigration(True)
         #self.maintainDatabase(True)
 
 class Create(CreateSql, Execute):
@@ -108,6 +111,18 @@ class Gets(GetSql, Execute):
             i = self.get("time", "int", t, True, False, i, whereTable = "item")
         return i
     
+class Views(ViewSql, Execute):
+    def __init__(self, db=None, printText=True, debug=False):
+        ViewSql.__init__(self, db, printText, debug, Execute)
+        self.execute()
+        
+    def execute(self, i=1):
+        i = self.fullView("user", i, columns=("concat(user.first_name, ' ', user.last_name) as user",))
+        columns = ("u.user", "l.user as leader")
+        joins = ("left join user_full u on u.user_id = item.user_id", "left join user_full l on l.user_id = item.leader_id")
+        i = self.fullView("item", i, "date", "description", "time", columns=columns, joins=joins)
+        return i
+    
 class Triggers(TriggerSql, Execute):
     def __init__(self, db=None, printText=True, debug=False):
         TriggerSql.__init__(self, db, printText, debug, Execute)
@@ -161,6 +176,19 @@ class PrepareUpdates(PreparedUpdateStatements, Execute):
         i = self.addSetArg("int", 2).addWhereArg().addMethod(i)
         return i
     
+class Statics(StaticStatements, Execute):
+    def __init__(self, db=None, printText=True, debug=False):
+        StaticStatements.__init__(self, db, printText, debug, Execute)
+        self.execute()
+        
+    def execute(self, i=1):
+        i = StaticStatements.execute(self, i)
+        for t in ("current_leader", "current_editor", "last_editor"):
+            i = self.updateProcedure(t, "user_id", i)
+        i = self.updateProcedure("users_scroll", "horizontal", i)
+        i = self.updateProcedure("logger_window", "maximized", i)
+        return i
+    
 class Adds(AddSql, Execute):
     def __init__(self, db=None, printText=True, debug=False):
         AddSql.__init__(self, db, printText, debug, Execute)
@@ -168,22 +196,24 @@ class Adds(AddSql, Execute):
         
     def execute(self, i=1):
         code = WriteSql()
-        code.append("call insert_id_string2('user', first_name, last_name)")
-        code.append("call insert_id_string1_int1('deliverable', deliverable, manage_user_id());")
+        code.append(self.insertCall("insert_id_string2", "user", "first_name", "last_name", idValue=0))
+        code.append(self.insertCall("insert_id_string1_int1", "deliverable", "deliverable", "manage_user_id()", idValue=0) + ";")
+        self.returnSelect(code, "select user.user_id, get_user(user.user_id) as user, deliverable_id, deliverable.deliverable from user, deliverable where user.user_id = get_user_id(first_name, last_name) and user.user_id = deliverable.user_id")
         args = "in first_name varchar(255), in last_name varchar(255), in deliverable varchar(255)"
         i = self.createProcedure("add_user", args, code, i)
         code.clear()
         code.append("set @user_id = get_user_id(first_name, last_name)")
-        code.append("call insert_int1('current_leader', @user_id);")
+        code.append(self.insertCall("insert_int1", "current_leader", "@user_id") + ";")
+        self.returnSelect(code, "select user_id, get_user(user_id) as user from current_leader")
         args = "in first_name varchar(255), in last_name varchar(255)"
         i = self.createProcedure("add_current_leader", args, code, i)
         code.clear()
         code.append("set @startDate = create_start_date(start_date)")
         code.append("set @endDate = create_end_date(@startDate, hours, minutes)")
-        code.append("call insert_id_int2('item', user_id, get_current_leader_id())")
-        code.append("call insert_item_id_datetime1_date1('date', @startDate, date(@endDate))")
-        code.append("call insert_item_id_string1('description', description)")
-        code.append("call insert_item_id_int2('time', hours, minutes);")
+        code.append(self.insertCall("insert_id_int2", "item", "user_id", "get_current_leader_id()", idValue=0))
+        code.append(self.insertCall("insert_item_id_datetime1_date1", "date", "@startDate", "date(@endDate)", idValue="manage_item_id()"))
+        code.append(self.insertCall("insert_item_id_string1", "description", "description", idValue="manage_item_id()"))
+        code.append(self.insertCall("insert_item_id_int2", "time", "hours", "minutes", idValue="manage_item_id()") + ";")
         args = "in user_id int, in start_date varchar(255), in description varchar(255), in hours int, in minutes int"
         i = self.createProcedure("add_item", args, code, i)
         return i
@@ -195,23 +225,28 @@ class Updates(UpdateSql, Execute):
         
     def execute(self, i=1):
         code = WriteSql()
-        code.append("call update_set_int1('current_leader', 'user_id', user_id);")
+        code.append(self.updateCall("update_set_int1", "current_leader", "user_id", "user_id") + ";")
+        self.returnSelect(code, "select current_leader.user_id, get_user(current_leader.user_id) as user from current_leader")
         args = "in user_id int"
         i = self.createProcedure("update_current_leader", args, code, i)
         code.clear()
-        code.append("call update_set_int1('current_editor', 'user_id', user_id);")
+        code.append(self.updateCall("update_set_int1", "current_editor", "user_id", "user_id") + ";")
+        self.returnSelect(code, "select current_editor.user_id, get_user(current_editor.user_id) as user from current_editor")
         args = "in user_id int"
         i = self.createProcedure("update_current_editor", args, code, i)
         code.clear()
-        code.append("call update_set_int1('last_editor', 'user_id', get_current_editor_id())")
-        code.append("call update_set_int1('current_editor', 'user_id', 0);")
+        code.append(self.updateCall("update_set_int1", "last_editor", "user_id", "get_current_editor_id()"))
+        code.append(self.updateCall("update_set_int1", "current_editor", "user_id", "0") + ";")
+        self.returnSelect(code, "select user_id, get_user(user_id) as user from last_editor")
         i = self.createProcedure("update_last_editor", "", code, i)
         code.clear()
-        code.append("call update_set_int1('users_scroll', 'horizontal', horizontal);")
+        code.append(self.updateCall("update_set_int1", "users_scroll", "horizontal", "horizontal") + ";")
+        self.returnSelect(code, "select users_scroll.horizontal from users_scroll")
         args = "in horizontal int"
         i = self.createProcedure("update_users_horizontal_scroll", args, code, i)
         code.clear()
-        code.append("call update_set_boolean1('logger_window', 'maximized', isMaximized);")
+        code.append(self.updateCall("update_set_boolean1", "logger_window", "maximized", "isMaximized") + ";")
+        self.returnSelect(code, "select get_logger_window_maximized() as maximized")
         args = "in isMaximized boolean"
         i = self.createProcedure("update_logger_window_maximized", args, code, i)
         code.clear()
@@ -227,34 +262,40 @@ class Start(StartSql, Execute):
         self.execute()
         
     def execute(self, i=1):
+        if self.isMigrating:
+            self.db.query("select count(*) as users from user", mode=PySql.RECORD_RESULTS)
+            if self.db.results[2][0]["users"] > 0:
+                return i
         if not self.isMaintained:
             firsts = ("Blythe", "Blake", "Dennis", "Gordon", "Aengus")
             lasts = ("Layne", "McCall", "Qiu", "Hendry", "Rafferty")
             deliverables = ("Requirements", "Planning", "Design", "User Guide and Testing Results", "Project Folder (includes program code)")
             users = tuple(zip(firsts, lasts, deliverables))
-            for (first_name, last_name, deliverable) in users:
-                self.db.callProcedure(None, "add_user", first_name, last_name, deliverable)
-                query = "select user.user_id, get_user(user.user_id) as user, deliverable_id, deliverable from user, deliverable where user.user_id = get_user_id(%s, %s) and user.user_id = deliverable.user_id"
-                self.db.setArgs(first_name, last_name).query(query)
-            self.db.callProcedure(None, "add_current_leader", firsts[0], lasts[0])
-            self.db.query("select user_id, get_user(user_id) as user from current_leader")
-            tables = ("current_editor", "last_editor")
-            for t in tables:
-                self.db.modify("insert into {} values ()".format(t))
-                self.db.query("select user_id, get_user(user_id) as user from {}".format(t))
-            self.db.modify("insert into users_scroll values ()")
-            self.db.query("select get_users_scroll_horizontal() as horizontal")
-            self.db.modify("insert into logger_window values ()")
-            self.db.query("select get_logger_window_maximized() as isMaximized")
+            with self.db.transaction(raiseError=True):
+                for (first_name, last_name, deliverable) in users:
+                    self.db.callProcedure(None, "add_user", first_name, last_name, deliverable)
+                self.db.callProcedure(None, "add_current_leader", firsts[0], lasts[0])
+                tables = ("current_editor", "last_editor")
+                for t in tables:
+                    self.db.modify("insert into {} values ()".format(t))
+                    self.db.query("select user_id, get_user(user_id) as user from {}".format(t))
+                self.db.modify("insert into users_scroll values ()")
+                self.db.query("select get_users_scroll_horizontal() as horizontal")
+                self.db.modify("insert into logger_window values ()")
+                self.db.query("select get_logger_window_maximized() as isMaximized")
            
 if __name__ == "__main__":
-    db = Create(printText=True, debug=True).db
+    pool = ConnectionPool.fromAccess()
+    db = Create(PySql(debug=True, pool=pool), printText=True, debug=True).db
     Checks(db, printText=True, debug=True)
     Gets(db, printText=True, debug=True)
+    Views(db, printText=True, debug=True)
     Triggers(db, printText=True, debug=True)
     PrepareInserts(db, printText=True, debug=True)
     PrepareUpdates(db, printText=True, debug=True)
+    Statics(db, printText=True, debug=True)
     Adds(db, printText=True, debug=True)
     Updates(db, printText=True, debug=True)
-    Start(db, printText=True, debug=True)
-    db.close()
\ No newline at end of file
+    Start(db, printText=True, debug=True).recordSchemaVersion()
+    db.close()
+    pool.close()
\ No newline at end of file
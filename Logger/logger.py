@@ -552,7 +552,7 @@ class Users(Form):
         deliverable = tuple(deliverable.values())[0]
         self.__deliverable = deliverable
         self.tablelize(True)
-        logger.db.query("select get_user(user_id) as user, user_id from user order by user_id")
+        logger.db.query("select user, user_id from user_full order by user_id")
         users = logger.db.results[2]
         users = dict([tuple(user.values()) for user in users])
         for u in users:
@@ -718,11 +718,11 @@ class Deliverable(Form):
         self.addButton(Refresh(logger)).addRow(Qt.AlignCenter)
     
 class Logger(ParentWindow):    
-    def __init__(self):
+    def __init__(self, pool = None):
         app = QApplication(sys.argv)
         self.__autoSize = False
         try:
-            self.db = AccessSql(True, accessType=AccessSql.PY_ACCESS)
+            self.db = AccessSql(True, accessType=AccessSql.PY_ACCESS) if pool is None else PySql(debug=True, pool=pool)
             self.__start = True
         except SystemExit as e:
             self.db = str(e)
@@ -814,9 +814,13 @@ class Logger(ParentWindow):
         ParentWindow.closeEvent(self, QEvent)
         if self.checkDb():
             self.db.callProcedure(None, "update_last_editor")
-            self.db.query("select user_id, get_user(user_id) as user from last_editor")
             self.db.close()
     
+    def __firstRow(self):
+        if self.db.results[1] is None or len(self.db.results[2]) == 0:
+            return None
+        return self.db.results[2][0]
+    
     def __getId(self, table):
         if self.checkDb():
             self.db.query("select get_{}_id() as id".format(table))
@@ -829,8 +833,7 @@ class Logger(ParentWindow):
                 self.db.callProcedure(None, "update_{}".format(table))
             else:
                 self.db.callProcedure(None, "update_{}".format(table), userId)
-            self.db.query("select user_id, get_user(user_id) as user from {}".format(table))
-            return self.db.results[2][0]
+            return self.__firstRow()
         return None
             
     def getCurrentLeaderId(self):
@@ -854,8 +857,8 @@ class Logger(ParentWindow):
     def updateWindowStateMaximized(self, isMaximized):
         if self.checkDb():
             self.db.callProcedure(None, "update_logger_window_maximized", isMaximized)
-            self.db.query("select get_logger_window_maximized() as maximized")
-            return bool(self.db.results[2][0]["maximized"])
+            row = self.__firstRow()
+            return None if row is None else bool(row["maximized"])
         return None
     
     def getWindowStateMaximized(self):
@@ -869,8 +872,8 @@ class Logger(ParentWindow):
         if not editorId is None:
             if editorId < 1:
                 self.db.callProcedure(None, "update_users_horizontal_scroll", value)
-                self.db.query("select horizontal from users_scroll")
-                return self.db.results[2][0]["horizontal"]
+                row = self.__firstRow()
+                return None if row is None else row["horizontal"]
         return None
             
     def getHorizontalScrollValue(self):
@@ -3,7 +3,11 @@ from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from pyqt5Custom import *
 from sshtunnel import SSHTunnelForwarder as ssh
-import mysql.connector as con, os, sys, re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+import mysql.connector as con, os, sys, re, threading, time, json, atexit, logging, hashlib, gzip, lzma, queue
 
 class WriteSql:
     def __init__(self):
@@ -54,6 +58,12 @@ class WriteSql:
                 self.code[i] = "primary key ({})".format(newPrimary)
         return self
         
+    def setAutoIncrement(self, column):
+        for i, c in enumerate(self.code):
+            if c.split(" ")[0] == column and not "auto_increment" in c:
+                self.code[i] = c + " auto_increment"
+        return self
+        
     def setForeignKey(self, key, table, tableKey):
         self.append("foreign key ({}) references {} ({})".format(key, table, tableKey))
         return self
@@ -99,55 +109,455 @@ class WriteSql:
     def __str__(self):
         return self.separator.join(self.code)
          
-class PySql:    
-    def __init__(self, host, user, password, database, port = 3306, debug = False):
+class Record(tuple):
+    '''A result row stored as a plain tuple. The column names are kept once on the record class 
+       shared by every row of a result, while indexing by column name, get, keys, values 
+       and items still work like the old dict rows.'''
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+    __types = {}
+    
+    @classmethod
+    def create(cls, cols):
+        '''Returns the record class for these columns, creating it once per column header.'''
+        if not cols in cls.__types:
+            cls.__types[cols] = type("Record", (cls,), {"__slots__": (), "_fields": cols, "_index": {c: i for i, c in enumerate(cols)}})
+        return cls.__types[cols]
+    
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+    
+    def __getattr__(self, name):
+        if name in self._index:
+            return tuple.__getitem__(self, self._index[name])
+        raise AttributeError(name)
+    
+    def get(self, key, default = None):
+        return self[key] if key in self._index else default
+    
+    def keys(self):
+        return self._fields
+    
+    def values(self):
+        return tuple(self)
+    
+    def items(self):
+        return tuple(zip(self._fields, self))
+    
+    def __repr__(self):
+        return dict(self.items()).__repr__()
+    
+class Columns:
+    '''Column major results. Each column is a single list in data and rows are only 
+       built, as Records, when they are indexed or iterated.'''
+    def __init__(self, cols, rows):
+        self.columns = cols
+        self.data = dict(zip(cols, [list(c) for c in zip(*rows)])) if len(rows) > 0 else {c: [] for c in cols}
+        self.__record = Record.create(cols)
+        self.__size = len(rows)
+        
+    def __len__(self):
+        return self.__size
+    
+    def __row(self, i):
+        return self.__record([self.data[c][i] for c in self.columns])
+    
+    def __getitem__(self, i):
+        if isinstance(i, str):
+            return self.data[i]
+        if isinstance(i, slice):
+            return [self.__row(j) for j in range(*i.indices(self.__size))]
+        if i < 0: i += self.__size
+        if i < 0 or i >= self.__size: raise IndexError("row index out of range")
+        return self.__row(i)
+    
+    def __iter__(self):
+        for i in range(self.__size):
+            yield self.__row(i)
+            
+    def __repr__(self):
+        return self.data.__repr__()
+        
+class Statement:
+    '''The readable text of a statement with its values filled in for %s. It is only built the first 
+       time it is printed or written, so statements that are never shown cost nothing.
+       quote - Puts string values in quotes.'''
+    __slots__ = ("sql", "vals", "quote", "__text")
+    
+    def __init__(self, sql, vals, quote = True):
+        self.sql = sql
+        self.vals = vals
+        self.quote = quote
+        self.__text = None
+        
+    def __str__(self):
+        if self.__text is None:
+            q = self.sql
+            for v in self.vals:
+                q = q.replace('%s', "'{}'".format(v) if self.quote and isinstance(v, str) else v.__str__(), 1)
+            self.__text = q
+        return self.__text
+    
+    def __repr__(self):
+        return self.__str__().__repr__()
+    
+    def __eq__(self, other):
+        return self.__str__() == other.__str__()
+    
+    def __hash__(self):
+        return self.__str__().__hash__()
+    
+class ResultsWriter:
+    '''Keeps a results file open and writes to it from a background thread. Text is flushed once 
+       bufferSize characters are waiting or every flushInterval seconds.
+       maxBytes - Rotates the file to path.1, path.2, ... once it grows past this size, keeping 
+                  backupCount old files. 0 never rotates.
+       jsonLines - Writes a JSON object for each statement and each row instead of plain text.'''
+    def __init__(self, path, bufferSize = 65536, flushInterval = 1, maxBytes = 0, backupCount = 3, jsonLines = False):
+        self.path = path
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self.jsonLines = jsonLines
+        self.__file = open(path, "a", encoding = "utf-8")
+        self.__buffer = []
+        self.__size = 0
+        self.__closed = False
+        self.__lock = threading.Condition()
+        self.__fileLock = threading.Lock()
+        self.__thread = threading.Thread(target = self.__run, daemon = True)
+        self.__thread.start()
+        atexit.register(self.close)
+        
+    def writeResults(self, results, index = None):
+        '''Writes a results tuple of PySql. A streamed result is consumed here.'''
+        self.writeStatement(results[0], results[1], index)
+        if not results[2] is None:
+            for r in results[2]:
+                self.writeRow(r, index)
+        return self.writeEnd()
+    
+    def writeStatement(self, statement, columns = None, index = None):
+        '''Starts a result with its statement. Its rows follow with writeRow and writeEnd ends it.'''
+        if self.jsonLines:
+            return self.write(json.dumps({"index": index, "statement": str(statement), "columns": columns}, default = str) + "\n")
+        return self.write(("" if index is None else "{}. ".format(index)) + str(statement) + "\n")
+    
+    def writeRow(self, row, index = None):
+        if self.jsonLines:
+            row = dict(row.items()) if hasattr(row, "items") else list(row)
+            return self.write(json.dumps({"index": index, "row": row}, default = str) + "\n")
+        return self.write(str(row) + "\n")
+    
+    def writeEnd(self):
+        return self if self.jsonLines else self.write("\n")
+    
+    def write(self, text):
+        with self.__lock:
+            if self.__closed:
+                raise ValueError("Results writer for {} is closed.".format(self.path))
+            while self.__size >= self.bufferSize * 4:
+                self.__lock.wait()
+            self.__buffer.append(text)
+            self.__size += len(text)
+            if self.__size >= self.bufferSize:
+                self.__lock.notify_all()
+        return self
+    
+    def __take(self):
+        with self.__lock:
+            buffer, self.__buffer, self.__size = (self.__buffer, [], 0)
+            self.__lock.notify_all()
+        return "".join(buffer)
+    
+    def __writeOut(self):
+        '''Takes the buffer and writes it under the file lock, so text taken first is written first.'''
+        with self.__fileLock:
+            text = self.__take()
+            if text != "":
+                self.__file.write(text)
+            self.__file.flush()
+            if self.maxBytes > 0 and self.__file.tell() >= self.maxBytes:
+                self.__rotate()
+                
+    def __rotate(self):
+        self.__file.close()
+        for i in range(self.backupCount-1, 0, -1):
+            if os.path.exists("{}.{}".format(self.path, i)):
+                os.replace("{}.{}".format(self.path, i), "{}.{}".format(self.path, i+1))
+        if self.backupCount > 0:
+            os.replace(self.path, "{}.1".format(self.path))
+        self.__file = open(self.path, "w", encoding = "utf-8")
+    
+    def __run(self):
+        while True:
+            with self.__lock:
+                if not self.__closed and self.__size < self.bufferSize:
+                    self.__lock.wait(self.flushInterval)
+                closed = self.__closed
+            self.__writeOut()
+            if closed:
+                break
+            
+    def flush(self):
+        '''Writes out everything buffered so far before returning.'''
+        self.__writeOut()
+        return self
+        
+    def close(self):
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__lock.notify_all()
+        self.__thread.join()
+        with self.__fileLock:
+            self.__file.close()
+        
+class SqlScript:
+    '''Splits a SQL script into statements while it is read, a line at a time. A delimiter inside quotes, 
+       backticks or comments doesn't end a statement, comments are left out and DELIMITER lines change 
+       the delimiter. Iterating yields (statement, line, column) with where each statement starts.
+       Each line is scanned with regular expressions for the next quote, comment or delimiter, 
+       and the text between them is copied in one piece.'''
+    QUOTE_ENDS = {"'": re.compile(r"(?s)\\.?|''?"), '"': re.compile(r'(?s)\\.?|""?'), "`": re.compile("``?")}
+    NON_SPACE = re.compile(r"\S")
+    
+    def __init__(self, lines, delimiter = ";"):
+        self.lines = lines
+        self.delimiter = delimiter
+        
+    @staticmethod
+    def scanner(delimiter):
+        '''Finds the next delimiter, quote, comment or comment start outside quotes.'''
+        return re.compile(r"(?P<delimiter>{})|(?P<quote>['\"`])|(?P<line>#|--(?=[ \t\r\n]|\Z))|(?P<comment>/\*(?!!))".format(re.escape(delimiter)))
+        
+    def __iter__(self):
+        scan = self.scanner(self.delimiter)
+        text, start, quote, comment = ([], None, None, False)
+        for n, line in enumerate(self.lines, 1):
+            if start is None and quote is None and not comment:
+                d = re.match(r"\s*delimiter\s+(\S+)", line, re.I)
+                if d:
+                    scan = self.scanner(d.group(1))
+                    continue
+            i = 0
+            while i < len(line):
+                if comment:
+                    end = line.find("*/", i)
+                    if end < 0: break
+                    i, comment = (end + 2, False)
+                    text.append(" ")
+                elif not quote is None:
+                    m = self.QUOTE_ENDS[quote].search(line, i)
+                    if m is None:
+                        text.append(line[i:])
+                        break
+                    text.append(line[i:m.end()])
+                    i = m.end()
+                    if m.group() == quote: quote = None
+                else:
+                    m = scan.search(line, i)
+                    end = len(line) if m is None else m.start()
+                    if start is None:
+                        w = self.NON_SPACE.search(line, i, end)
+                        if not w is None: start = (n, w.start()+1)
+                    text.append(line[i:end])
+                    if m is None: break
+                    i = m.end()
+                    if m.lastgroup == "delimiter":
+                        s = "".join(text).strip()
+                        if s != "": yield (s, start[0], start[1])
+                        text, start = ([], None)
+                    elif m.lastgroup == "line":
+                        text.append("\n")
+                        break
+                    elif m.lastgroup == "comment":
+                        comment = True
+                    else:
+                        if start is None: start = (n, end+1)
+                        quote = m.group()
+                        text.append(quote)
+        s = "".join(text).strip()
+        if s != "": yield (s, start[0], start[1])
+        
+class BackupWriter:
+    '''Writes a backup file from a worker thread, so compressing and writing overlap with fetching rows.
+       compression - None, "gz" or "xz". The extension is added to path.
+       queueSize - Most chunks waiting to be written. write blocks once that many are queued.'''
+    EXTENSIONS = {None: "", "gz": ".gz", "xz": ".xz"}
+    
+    def __init__(self, path, compression = None, queueSize = 16):
+        if not compression in self.EXTENSIONS:
+            raise ValueError("Unknown compression {}. Use one of {}.".format(compression, list(self.EXTENSIONS)))
+        self.path = path + self.EXTENSIONS[compression]
+        self.compression = compression
+        self.__file = self.open(self.path, "wt")
+        self.__queue = queue.Queue(queueSize)
+        self.__error = None
+        self.__thread = threading.Thread(target = self.__run, daemon = True)
+        self.__thread.start()
+        
+    @staticmethod
+    def open(path, mode = "rt"):
+        '''Opens a text backup file, compressed or not depending on its extension.'''
+        if path.endswith(".gz"):
+            return gzip.open(path, mode, encoding = "utf-8", compresslevel = 6)
+        if path.endswith(".xz"):
+            return lzma.open(path, mode, encoding = "utf-8")
+        return open(path, mode.replace("t", ""), encoding = "utf-8")
+        
+    def __run(self):
+        while True:
+            text = self.__queue.get()
+            if text is None:
+                break
+            if self.__error is None:
+                try:
+                    self.__file.write(text)
+                except Exception as e:
+                    self.__error = e
+                    
+    def write(self, text):
+        if not self.__error is None:
+            raise self.__error
+        self.__queue.put(text)
+        return self
+    
+    def close(self):
+        '''Waits for everything queued to be written, then closes the file.'''
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__file.close()
+        if not self.__error is None:
+            raise self.__error
+    
+class PySql:
+    DICT_RESULTS = "dict"
+    TUPLE_RESULTS = "tuple"
+    RECORD_RESULTS = "record"
+    COLUMN_RESULTS = "column"
+    
+    def __init__(self, host = None, user = None, password = None, database = "", port = 3306, debug = False, pool = None, localInfile = False):
+        '''pool - Checks out a connection from a ConnectionPool instead of opening one. 
+                  close() gives it back to the pool.
+           localInfile - Allows LOAD DATA LOCAL INFILE, used by bulkRestoreTable.'''
+        self.pool = pool
+        self.__connect = {"host": host, "user": user, "password": password, "database": database, "port": port, "localInfile": localInfile}
+        if not pool is None:
+            try:
+                self.db = pool.checkout()
+                self.__setup(pool.database, debug)
+                return
+            except con.Error:
+                sys.exit("No pooled connection is available.")
         for _ in range(2):
             e = database == ""
             try:
-                self.db = con.connect(host = host, port = port, user = user, password = password, database = database)
-                self.db_name = database
-                self.cursor = self.db.cursor()
-                self.debug = debug
-                self.results = None
-                self.__vals = None
-                self.connectionType = "py"
+                self.db = con.connect(host = host, port = port, user = user, password = password, database = database, allow_local_infile = localInfile)
+                self.__setup(database, debug)
             except:
                 try:
-                    self.db = con.connect(host = host, port = port, user = user, password = password)
-                    self.db_name = database
-                    self.cursor = self.db.cursor()
+                    self.db = con.connect(host = host, port = port, user = user, password = password, allow_local_infile = localInfile)
+                    self.__setup(database, debug)
                     self.cursor.execute("set sql_notes = 0")
                     self.cursor.execute("create database if not exists {}".format(database))
                     self.cursor.execute("use database {}".format(database))
-                    self.debug = debug
-                    self.results = None
-                    self.__vals = None
                 except:
                     e = True
         if e: 
             sys.exit("Please enter a valid host, user, password, or database.")
+            
+    def __setup(self, database, debug):
+        self.db_name = database
+        self.__stream = None
+        self.__cursor = self.db.cursor()
+        self.debug = debug
+        self.results = None
+        self.__vals = None
+        self.batchSize = 1000
+        self.resultMode = self.DICT_RESULTS
+        self.connectionType = "py"
+        self.__transactions = []
+        self.lastTransactionRolledBack = False
+        self.procedureArgs = ()
+        self.procedureResults = []
+        self.__batch = []
+        self.batchError = None
+        self.__prepared = None
+        self.__unpreparable = set()
+        self.preparedHits = 0
+        self.preparedMisses = 0
+        self.__queryCache = None
+        self.__views = None
+        self.__sideEffects = None
+        self.__queryError = None
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.__writers = {}
+        self.setLogger()
+        
+    @staticmethod
+    def defaultLogger():
+        '''The "pySql" logger. Unless it was configured elsewhere it prints messages to stdout, like print did.'''
+        log = logging.getLogger("pySql")
+        if len(log.handlers) == 0:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            log.addHandler(handler)
+            log.setLevel(logging.INFO)
+            log.propagate = False
+        return log
+    
+    def setLogger(self, log = None, maxRows = None):
+        '''Where debug output goes.
+           log - A logging.Logger. None uses defaultLogger.
+           maxRows - Most rows of a result printed by printResults. The rest are only counted.'''
+        self.logger = self.defaultLogger() if log is None else log
+        self.maxRows = maxRows
+        return self
                         
     def printResults(self, index = None, printText = True, debug = True):
-        '''Print out data results.
+        '''Print out data results, as one message to the logger.
            printText - Allows data results to be printed.
            index - Prints out a number.
-           Note: It may be better to set printText = False if the result being printed is large.'''
+           Note: It may be better to set printText = False if the result being printed is large, or 
+           to limit the rows printed with setLogger(maxRows = ...).
+           Streamed results are consumed by printing them.'''
         if debug:
-            print(("" if index is None else "{}. ".format(index)) + (self.results[0] if printText else ""))
+            lines = [("" if index is None else "{}. ".format(index)) + (self.results[0].__str__() if printText else "")]
             if not self.results[2] is None:
-                [print(r) for r in self.results[2]]
-            print()
+                rows = iter(self.results[2])
+                lines += [r.__str__() for r in islice(rows, self.maxRows)]
+                more = sum(1 for _ in rows)
+                if more > 0: lines.append("... {} more rows".format(more))
+            lines.append("")
+            self.logger.info("\n".join(lines))
         return self
             
     def writeResults(self, index = None, out = ""):
-        '''Write out data results to a file.'''
+        '''Write out data results to a file.
+           The file stays open in a ResultsWriter, which writes it in the background, until 
+           closeResults or close is called. Streamed results are consumed by writing them.'''
         if out != "":
-            w = open(out, "a+")
-            w.write(("" if index is None else "{}. ".format(index)) + self.results[0] + "\n")
-            if not self.results[2] is None:
-                [w.write(str(r) + "\n") for r in self.results[2]]
-            w.write("\n")
-            w.close()
+            self.resultsWriter(out).writeResults(self.results, index)
+        return self
+    
+    def resultsWriter(self, out, **options):
+        '''Returns the ResultsWriter of a file, creating it with options (see ResultsWriter) the first time.'''
+        if not out in self.__writers:
+            self.__writers[out] = ResultsWriter(out, **options)
+        return self.__writers[out]
+    
+    def closeResults(self, out = None):
+        '''Flushes and closes the writer of a results file, or of every file if out is None.'''
+        for o in list(self.__writers) if out is None else [out]:
+            if o in self.__writers:
+                self.__writers.pop(o).close()
         return self
             
     def use(self, database, debug = None):
@@ -155,21 +565,310 @@ class PySql:
         if debug is None: debug = self.debug
         u = "use {}".format(database)
         self.cursor.execute(u)
-        if debug: print(u)
+        if debug: self.logger.info(u)
+        self.db_name = database
+        self.__invalidate()
         return self
     
-    def columns(self):
+    def columns(self, cursor = None):
         '''Returns columns of a table.'''
-        return tuple([f[0] for f in self.cursor.description])
+        if cursor is None: cursor = self.cursor
+        return tuple([f[0] for f in cursor.description])
         
     def setArgs(self, *vals):
         self.__vals = vals
         return self
+    
+    def setBatchSize(self, batchSize):
+        '''Number of rows fetched from the server at a time when streaming results.'''
+        self.batchSize = batchSize
+        return self
+    
+    def setResultMode(self, mode):
+        '''How query stores rows in results[2]:
+           DICT_RESULTS - A list of dicts, one per row (default).
+           TUPLE_RESULTS - A list of plain tuples. The column names are only in results[1].
+           RECORD_RESULTS - A list of Records, tuples that share one column header and 
+                            still allow row["column"], keys, values and items.
+           COLUMN_RESULTS - One Columns object holding a list per column.'''
+        self.resultMode = mode
+        return self
+    
+    def __rowFactory(self, cols, mode):
+        if mode == self.TUPLE_RESULTS:
+            return tuple
+        if mode == self.DICT_RESULTS:
+            return lambda row: dict(zip(cols, row))
+        return Record.create(cols)
+    
+    def __rows(self, cols, rows, mode):
+        if mode == self.TUPLE_RESULTS:
+            return rows
+        if mode == self.COLUMN_RESULTS:
+            return Columns(cols, rows)
+        return list(map(self.__rowFactory(cols, mode), rows))
+    
+    def __streamRows(self, cursor, cols, batchSize, mode):
+        '''Column results can't be streamed, so COLUMN_RESULTS streams Records.'''
+        row = self.__rowFactory(cols, mode)
+        try:
+            while self.__stream is cursor:
+                rows = cursor.fetchmany(batchSize)
+                if len(rows) == 0: break
+                for r in rows:
+                    yield row(r)
+        finally:
+            if self.__stream is cursor: self.__endStream()
+    
+    def __streamOut(self, rows, q, cols, index, printText, debug, out):
+        '''Prints and writes the rows of a streamed query as they are consumed, as printResults 
+           and writeResults do for other queries.'''
+        writer = None if out == "" else self.resultsWriter(out).writeStatement(q, cols, index)
+        lines, more = ([("" if index is None else "{}. ".format(index)) + (q.__str__() if printText else "")], 0)
+        try:
+            for r in rows:
+                if debug:
+                    if self.maxRows is None or len(lines) <= self.maxRows: lines.append(r.__str__())
+                    else: more += 1
+                if not writer is None: writer.writeRow(r, index)
+                yield r
+        finally:
+            rows.close()
+            if debug:
+                if more > 0: lines.append("... {} more rows".format(more))
+                lines.append("")
+                self.logger.info("\n".join(lines))
+            if not writer is None: writer.writeEnd()
+    
+    @property
+    def cursor(self):
+        '''The buffered cursor statements are sent with. Getting it ends an open stream first, so 
+           nothing sent through it finds an unread result.'''
+        self.__endStream()
+        return self.__cursor
+    
+    def __endStream(self):
+        '''Reads what is left of a streamed query, so the connection can run the next statement.'''
+        if not self.__stream is None:
+            cursor, self.__stream = (self.__stream, None)
+            try:
+                self.db.consume_results()
+            finally:
+                cursor.close()
         
     def primaries(self, table):
         '''Returns primary keys of the table.'''
-        return tuple([d["Column_name"] for d in self.setArgs("PRIMARY").query("show keys from {} where Key_name = %s".format(table)).results[2]])
+        return tuple([d["Column_name"] for d in self.setArgs("PRIMARY").query("show keys from {} where Key_name = %s".format(table), mode = self.RECORD_RESULTS).results[2]])
+    
+    @contextmanager
+    def transaction(self, raiseError = False):
+        '''with db.transaction(): ...
+           Groups statements into one transaction. modify, modifyMany and callProcedure don't commit 
+           inside it. It commits when the scope ends, or rolls back if an exception is raised or one 
+           of its statements failed. A nested scope uses a savepoint, so only its own work is rolled back.
+           lastTransactionRolledBack tells whether the scope that ended last was rolled back.
+           raiseError - Raises con.Error when a failed statement rolled the scope back.'''
+        depth = len(self.__transactions)
+        savepoint = "pysql_savepoint_{}".format(depth)
+        if depth > 0: self.cursor.execute("savepoint {}".format(savepoint))
+        self.__transactions.append(False)
+        try:
+            yield self
+        except:
+            self.__transactions.pop()
+            self.__rollback(depth, savepoint)
+            self.lastTransactionRolledBack = True
+            raise
+        self.__endStream()
+        self.lastTransactionRolledBack = self.__transactions.pop()
+        if self.lastTransactionRolledBack:
+            self.__rollback(depth, savepoint)
+            if raiseError: raise con.Error(msg = "Transaction rolled back because one of its statements failed.")
+        elif depth > 0:
+            self.cursor.execute("release savepoint {}".format(savepoint))
+        else:
+            self.db.commit()
+            
+    def __rollback(self, depth, savepoint):
+        self.__endStream()
+        if depth > 0:
+            self.cursor.execute("rollback to savepoint {}".format(savepoint))
+            self.cursor.execute("release savepoint {}".format(savepoint))
+        else:
+            self.db.rollback()
+            
+    def inTransaction(self):
+        return len(self.__transactions) > 0
+            
+    def __commit(self):
+        if not self.inTransaction(): self.db.commit()
+        
+    def __fail(self):
+        if self.inTransaction(): self.__transactions[-1] = True
+        
+    def usePreparedStatements(self, use = True, maxSize = 100):
+        '''Runs query, and modify, through server-side prepared statements that are cached by SQL text, 
+           so repeated statements are only sent and parsed once. The least recently used statement is 
+           closed once maxSize, or the server's max_prepared_stmt_count if that is lower, is reached.
+           Statements are prepared again after a reconnect.'''
+        self.__closePrepared()
+        self.preparedHits = 0
+        self.preparedMisses = 0
+        if use:
+            self.cursor.execute("select @@global.max_prepared_stmt_count")
+            self.__preparedLimit = max(1, min(maxSize, int(self.cursor.fetchall()[0][0])))
+            self.__prepared = OrderedDict()
+            self.__preparedConnection = self.db.connection_id
+        return self
+    
+    def preparedStats(self):
+        '''Returns hit and miss counters of the prepared statement cache.'''
+        size = 0 if self.__prepared is None else len(self.__prepared)
+        return {"hits": self.preparedHits, "misses": self.preparedMisses, "size": size}
+    
+    def __closePrepared(self):
+        if not self.__prepared is None:
+            for (c, _) in self.__prepared.values():
+                try:
+                    c.close()
+                except con.Error:
+                    pass
+            self.__prepared = None
+        
+    def __preparedCursor(self, q):
+        if self.db.connection_id != self.__preparedConnection:
+            self.__prepared.clear()
+            self.__preparedConnection = self.db.connection_id
+        if q in self.__prepared:
+            self.preparedHits += 1
+            self.__prepared.move_to_end(q)
+        else:
+            self.preparedMisses += 1
+            self.__prepared[q] = (self.db.cursor(prepared = True), q)
+            if len(self.__prepared) > self.__preparedLimit:
+                self.__prepared.popitem(last = False)[1][0].close()
+        return self.__prepared[q]
     
+    def __execute(self, q, vals):
+        '''Runs q on its cached prepared cursor, or on self.cursor if prepared statements are off 
+           or the server can't prepare it. Returns the cursor that ran it.'''
+        self.__endStream()
+        if self.__prepared is None or q in self.__unpreparable:
+            if vals is None:
+                self.cursor.execute(q)
+            else:
+                self.cursor.execute(q, vals)
+            return self.cursor
+        c, q = self.__preparedCursor(q)
+        try:
+            c.execute(q, () if vals is None else vals)
+            return c
+        except con.Error as e:
+            if e.errno != 1295: raise
+            self.__prepared.pop(q)[0].close()
+            self.__unpreparable.add(q)
+            return self.__execute(q, vals)
+        
+    def useQueryCache(self, use = True, maxSize = 256, ttl = 60):
+        '''Keeps the results of select queries, keyed by the SQL and its setArgs values, for ttl seconds, 
+           dropping the least recently used once maxSize are kept. Writes through modify, modifyMany, 
+           executeBatch, truncate and source drop the cached queries that read the tables they touch. 
+           Queries calling stored functions may read any table and procedures may write any table, so 
+           those are dropped by every write and every callProcedure. A query on a view is dropped by 
+           writes to the tables the view reads. A write to a table with triggers or with cascading foreign 
+           keys may change other tables, so it drops every query, as does use. Writes from other 
+           connections are only seen once ttl runs out. Nothing is cached inside a transaction.'''
+        self.__queryCache = OrderedDict() if use else None
+        self.__cacheSize = maxSize
+        self.__cacheTtl = ttl
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        return self
+    
+    def clearQueryCache(self):
+        if not self.__queryCache is None: self.__queryCache.clear()
+        return self
+    
+    __BUILT_IN_FUNCTIONS = {"count", "sum", "min", "max", "avg", "concat", "ifnull", "coalesce", "date", "timestamp", "lower", "upper", "trim", "in"}
+    
+    def __readTables(self, q):
+        '''Tables a select reads, or None if it calls a stored function and could read anything.'''
+        q = q.lower()
+        for f in re.findall(r"(\w+)\s*\(", q):
+            if not f in self.__BUILT_IN_FUNCTIONS:
+                return None
+        return frozenset(re.findall(r"(?:\bfrom\b|\bjoin\b|,)\s*(?:`?\w+`?\.)?`?(\w+)`?", q))
+    
+    def __baseTables(self, tables):
+        '''Replaces the views in tables with the tables they read.'''
+        if self.__views is None:
+            self.cursor.execute("select table_name, view_definition from information_schema.views where table_schema = %s", (self.db_name,))
+            self.__views = {v.lower(): self.__readTables(d) for (v, d) in self.cursor.fetchall()}
+        base = set()
+        for t in tables:
+            if not t in self.__views:
+                base.add(t)
+            elif self.__views[t] is None:
+                return None
+            else:
+                read = self.__baseTables(self.__views[t] - {t})
+                if read is None: return None
+                base |= read
+        return frozenset(base)
+    
+    def __sideEffectTables(self):
+        '''Tables whose writes also write other tables, through a trigger or a cascading foreign key.'''
+        if self.__sideEffects is None:
+            self.cursor.execute("select event_object_table from information_schema.triggers where trigger_schema = %s", (self.db_name,))
+            tables = {t.lower() for (t,) in self.cursor.fetchall()}
+            self.cursor.execute("select referenced_table_name from information_schema.referential_constraints where constraint_schema = %s " +
+                                "and (delete_rule not in ('RESTRICT', 'NO ACTION') or update_rule not in ('RESTRICT', 'NO ACTION'))", (self.db_name,))
+            self.__sideEffects = tables | {t.lower() for (t,) in self.cursor.fetchall()}
+        return self.__sideEffects
+    
+    def __writtenTable(self, q):
+        '''Table written by an insert, replace, update, delete or truncate, or None if unknown.'''
+        r = re.match(r"\s*(?:insert\s+(?:ignore\s+)?into|replace\s+into|update|delete\s+from|truncate(?:\s+table)?)\s+`?(\w+)`?", q, re.I)
+        return None if r is None else r.group(1).lower()
+    
+    def __cacheKey(self, q, vals, mode):
+        if self.__queryCache is None or self.inTransaction() or not self.__checkStatements(q.strip(), "select"):
+            return None
+        return (self.db_name, q, vals, mode)
+    
+    def __cached(self, key):
+        c = self.__queryCache.get(key)
+        if not c is None and c[0] > time.monotonic():
+            self.cacheHits += 1
+            self.__queryCache.move_to_end(key)
+            self.results = c[2]
+            return True
+        self.cacheMisses += 1
+        return False
+    
+    def __cache(self, key):
+        tables = self.__readTables(key[1])
+        if not tables is None: tables = self.__baseTables(tables)
+        self.__queryCache[key] = (time.monotonic() + self.__cacheTtl, tables, self.results)
+        self.__queryCache.move_to_end(key)
+        if len(self.__queryCache) > self.__cacheSize:
+            self.__queryCache.popitem(last = False)
+        
+    def __invalidate(self, q = None):
+        '''Drops cached queries that read the table q writes. q None, or an unknown write, drops every query.'''
+        table = None if q is None else self.__writtenTable(q)
+        if table is None: 
+            self.__views = None
+            self.__sideEffects = None
+        if self.__queryCache is None or len(self.__queryCache) == 0:
+            return
+        if not table is None and table in self.__sideEffectTables(): table = None
+        if table is None:
+            self.__queryCache.clear()
+        else:
+            for key in [k for k, c in self.__queryCache.items() if c[1] is None or table in c[1]]:
+                self.__queryCache.pop(key)
+        
     def __checkError(self, err):
         if "Duplicate" in err:
             r = re.search("entry '.*'.* key '.*\.(.*)'", err)
@@ -178,43 +877,142 @@ class PySql:
     
     def modify(self, query, *vals):
         '''For inserts, updates, or deletes. Statements that modify the database.'''
+        self.__invalidate(query)
         try:
             if len(vals) < 1:
-                query = query.replace("!!NEWLINE!!", "\n")
-                q = query.split("!!VALS!!")
-                vals = [int(v[:-len("!!INT!!")]) if "!!INT!!" in v else v[1:-1] for v in q[1:]]
-                self.cursor.execute(q[0], vals)
-                query = query.replace("!!VALS!!", "").replace("!!INT!!", "")
-            else:
-                self.cursor.execute(query, vals)
-            self.db.commit()
-            for v in vals: query = query.replace("%s", str(v), 1)
-            return query
+                query, vals = self.__backupStatement(query)
+            self.__execute(query, vals if len(vals) > 0 else None)
+            self.__commit()
+            return Statement(query, vals, False)
         except con.Error as e:
+            self.__fail()
             return self.__checkError(e.msg)
         
-    def query(self, q, index = None, printText = True, debug = None, out = ""):
+    def modifyMany(self, query, rows, chunkSize = None):
+        '''Runs one insert, update or delete for every tuple of values in rows. Each chunk of 
+           chunkSize rows is sent with executemany, which turns inserts into multi-row inserts, 
+           and committed once. A chunk that fails is rolled back and the next chunk still runs.
+           Inside a transaction nothing is committed and a failed chunk fails the transaction.
+           Returns a dict of chunk number, rows affected and error for each chunk.'''
+        if chunkSize is None: chunkSize = self.batchSize
+        self.__invalidate(query)
+        chunks, chunk = ([], [])
+        for r in rows:
+            chunk.append(tuple(r))
+            if len(chunk) == chunkSize:
+                chunks.append(self.__modifyChunk(query, chunk, len(chunks)+1))
+                chunk = []
+        if len(chunk) > 0:
+            chunks.append(self.__modifyChunk(query, chunk, len(chunks)+1))
+        return chunks
+    
+    def __modifyChunk(self, query, chunk, number):
+        try:
+            self.cursor.executemany(query, chunk)
+            count = self.cursor.rowcount
+            self.__commit()
+            return {"chunk": number, "rows": count, "error": None}
+        except con.Error as e:
+            if self.inTransaction():
+                self.__fail()
+            else:
+                self.db.rollback()
+            return {"chunk": number, "rows": 0, "error": self.__checkError(e.msg)}
+        
+    def query(self, q, index = None, printText = True, debug = None, out = "", stream = False, batchSize = None, mode = None):
         '''Statements that don't modify the database and just pull out data, 
-           such as select statements.'''
+           such as select statements.
+           stream - Uses an unbuffered cursor so results[2] becomes a generator that fetches 
+                    batchSize rows at a time. Its rows are printed, as with debug, and written 
+                    to out while it is consumed, and once it ends. Whatever is left of a stream 
+                    that isn't consumed is read and dropped by the next use of cursor, the next 
+                    query, the end of a transaction or close.
+           mode - Result mode for this query only. See setResultMode.'''
+        self.__endStream()
+        self.__queryError = None
+        cursor = self.db.cursor(buffered = False) if stream else self.cursor
         try:
             if debug is None: debug = self.debug
-            if self.__vals is None:
-                if q.strip() != "": self.cursor.execute(q)
-            else:
-                if q.strip() != "":
-                    self.cursor.execute(q, self.__vals)
-                    for v in self.__vals:
-                        q = q.replace('%s', "'{}'".format(v) if isinstance(v, str) else v.__str__(), 1)
-                self.__vals = None
+            if batchSize is None: batchSize = self.batchSize
+            if mode is None: mode = self.resultMode
+            vals, self.__vals = (self.__vals, None)
+            key = None if stream else self.__cacheKey(q, vals, mode)
+            if not key is None and self.__cached(key):
+                return self.printResults(index, printText, debug).writeResults(index, out)
             if q.strip() == "":
                 self.results = ("Query cannot be empty. Please enter a query.", None, None)
             else:
-                cols = self.columns()
-                self.results = (q, cols, [dict(zip(cols, row)) for row in self.cursor.fetchall()])
+                if not stream:
+                    cursor = self.__execute(q, vals)
+                elif vals is None:
+                    cursor.execute(q)
+                else:
+                    cursor.execute(q, vals)
+                if not vals is None: q = Statement(q, vals)
+                cols = self.columns(cursor)
+                if stream:
+                    self.__stream = cursor
+                    rows = self.__streamRows(cursor, cols, batchSize, mode)
+                    self.results = (q, cols, self.__streamOut(rows, q, cols, index, printText, debug, out))
+                    return self
+                self.results = (q, cols, self.__rows(cols, cursor.fetchall(), mode))
+                if not key is None: self.__cache(key)
         except con.Error as e:
+            self.__queryError = e.msg
             self.results = (self.__checkError(e.msg), None, None)
+        if stream: cursor.close()
         return self.printResults(index, printText, debug).writeResults(index, out)
     
+    def queue(self, q, *vals):
+        '''Adds a statement and its values to the batch sent by executeBatch. A call can return several 
+           results, which executeBatch can't match to its statements, so use callProcedure for it.'''
+        if self.__checkStatements(q.strip(), "call"):
+            raise ValueError("Can't queue {}. Use callProcedure for calls.".format(q.strip()))
+        self.__batch.append((q, vals))
+        return self
+    
+    def executeBatch(self, index = None, printText = True, debug = None, raiseError = False):
+        '''Sends every queued statement in one multi-statement request and commits once.
+           results[2] then holds a results tuple per statement, in order. The server stops at a 
+           failing statement: its entry holds the error, the statements after it are marked as 
+           not run and batchError is set to (position, statement, error).
+           raiseError - Raises the error once it is recorded, for callers that can't go on without it.'''
+        if debug is None: debug = self.debug
+        batch, self.__batch = (self.__batch, [])
+        self.batchError = None
+        hasVals = any(len(vals) > 0 for (_, vals) in batch)
+        statements, vals, printed = ([], [], [])
+        for (q, v) in batch:
+            q = q.strip().rstrip(";")
+            if not self.__checkStatements(q, "select"): self.__invalidate(q)
+            statements.append(q if len(v) > 0 or not hasVals else q.replace("%", "%%"))
+            vals += v
+            printed.append(Statement(q, v))
+        r, error = ([], None)
+        if len(batch) > 0:
+            try:
+                for c in self.cursor.execute(";\n".join(statements), vals if hasVals else None, multi = True):
+                    if c.with_rows:
+                        cols = tuple(c.column_names)
+                        r.append((printed[len(r)], cols, self.__rows(cols, c.fetchall(), self.resultMode)))
+                    else:
+                        r.append((printed[len(r)], None, None))
+                self.__commit()
+            except con.Error as e:
+                error = e
+                position = len(r)
+                self.batchError = (position+1, printed[position], self.__checkError(e.msg))
+                r.append((self.batchError[2], None, None))
+                r += [("Not run: {}".format(q), None, None) for q in printed[position+1:]]
+                self.__fail()
+                if not self.inTransaction(): self.db.commit()
+        for j, result in enumerate(r):
+            self.results = result
+            self.printResults(j+1 if index is None else "{}.{}".format(index, j+1), printText, debug)
+        self.results = ("Batch of {} statements".format(len(batch)), None, r)
+        if raiseError and not error is None: raise error
+        return self
+    
     def __checkStatements(self, statement, *check):
         if len(check) > 0:
             for c in check:
@@ -223,68 +1021,469 @@ class PySql:
         return False
     
     def source(self, readFile, outFile = "", printText = True, debug = None):
-        '''Executes queries and statements in .txt or .sql files.'''
+        '''Executes queries and statements in .txt or .sql files. A .sql file is split into statements 
+           by SqlScript and a .txt backup file has one statement per line. Runs of inserts, updates and 
+           deletes are sent batchSize at a time, as one multi-row statement when they share the same 
+           statement or else as one multi-statement request. Errors give the line and column of the 
+           statement that failed.'''
         if debug is None: debug = self.debug
-        if outFile != "" and os.path.exists(outFile): os.remove(outFile)
-        readFile = os.path.dirname(__file__) + "\\" + readFile
-        print("Source " + readFile + "\n")
-        r, q, s = ([], open(readFile, encoding = "utf-8"), "")
-        for i in q: 
+        if outFile != "":
+            self.closeResults(outFile)
+            if os.path.exists(outFile): os.remove(outFile)
+        readFile = self.__sourcePath(readFile)
+        self.logger.info("Source " + readFile + "\n")
+        r, pending = ([], [])
+        with BackupWriter.open(readFile) as f:
             if ".sql" in readFile:
-                b = "#" in i or "--" in i or "delimiter" in i
-                if b: continue
-                else:
-                    if i.strip() == "":
-                        if s == "": continue
-                    else:
-                        i = str(i).replace("$$", "")
-                        s += i
-                        continue
-            elif ".txt" in readFile: 
-                if i.strip() == "": continue
-                else: s = i
-            if self.__checkStatements(s, "set", "use"):
-                self.cursor.execute(s)
+                statements = SqlScript(f)
             else:
+                statements = ((l, n, 1) for n, l in enumerate(map(str.strip, f), 1) if l != "")
+            for (s, line, column) in statements:
+                if self.__checkStatements(s, "insert", "update", "delete", "replace"):
+                    pending.append((s, line, column))
+                    if len(pending) >= self.batchSize: 
+                        self.__sourceBatch(pending, r, outFile, printText, debug)
+                    continue
+                self.__sourceBatch(pending, r, outFile, printText, debug)
                 j = len(r)+1
-                if self.__checkStatements(s, "insert", "update", "delete"):
-                    m = self.modify(s)
-                    self.results = (m, None, None)
-                    self.printResults(j, printText, debug).writeResults(j, outFile)
-                    r.append(m)
-                elif self.__checkStatements(s, "create", "drop"):
-                    self.cursor.execute(s)
-                    self.results = (s, None, None)
-                    self.printResults(j, printText, debug).writeResults(j, outFile)
-                    r.append(s)
-                else: 
-                    r.append(self.query(s, index=j, printText=printText, debug=debug, out=outFile).results)
-            s = ""
-        q.close()
+                try:
+                    if self.__checkStatements(s, "use"):
+                        self.use(s.split()[1].strip("`"), debug = False)
+                        continue
+                    elif self.__checkStatements(s, "set"):
+                        self.cursor.execute(s)
+                        continue
+                    elif self.__checkStatements(s, "create", "drop"):
+                        self.__invalidate()
+                        self.cursor.execute(s)
+                        self.results = (s, None, None)
+                    else: 
+                        self.query(s, printText = printText, debug = False)
+                        if self.__queryError is None:
+                            self.printResults(j, printText, debug).writeResults(j, outFile)
+                            r.append(self.results)
+                            continue
+                        self.results = (self.__sourceError(self.__queryError, line, column), None, None)
+                except con.Error as e:
+                    self.results = (self.__sourceError(e.msg, line, column), None, None)
+                self.printResults(j, printText, debug).writeResults(j, outFile)
+                r.append(self.results[0])
+            self.__sourceBatch(pending, r, outFile, printText, debug)
+        if outFile != "": self.resultsWriter(outFile).flush()
         self.results = (readFile, "", r)
         return self
     
-    def backupTable(self, table):
-        '''Backs up table.'''
-        bd = self.query("show columns from {}".format(table)).results[2]
+    def __sourceError(self, err, line, column):
+        return "{} (line {}, column {})".format(self.__checkError(err), line, column)
+    
+    def __sourceBatch(self, pending, r, outFile, printText, debug):
+        '''Sends the statements source has gathered and empties pending.'''
+        if len(pending) == 0: return
+        batch = [self.__backupStatement(s) for (s, _, _) in pending]
+        j = len(r)+1
+        if len(batch) > 1 and all(len(v) > 0 and q == batch[0][0] for (q, v) in batch):
+            chunk = self.modifyMany(batch[0][0], [v for (_, v) in batch], len(batch))[0]
+            if chunk["error"] is None:
+                self.results = ("{} rows: {}".format(len(batch), batch[0][0]), None, None)
+                self.printResults(j, printText, debug).writeResults(j, outFile)
+                r.append(self.results[0])
+                pending.clear()
+                return
+        k = 0
+        while k < len(batch):
+            for (q, v) in batch[k:]:
+                self.queue(q, *v)
+            results = self.executeBatch(printText = False, debug = False).results[2]
+            if not self.batchError is None:
+                results = results[:self.batchError[0]]
+                results[-1] = (self.__sourceError(self.batchError[2], *pending[k+len(results)-1][1:]), None, None)
+            for result in results:
+                self.results = result
+                self.printResults(j+k, printText, debug).writeResults(j+k, outFile)
+                r.append(result[0])
+                k += 1
+        pending.clear()
+    
+    def __backupStatement(self, query):
+        '''Splits a backupTable line into its statement and values. Other statements have no values.'''
+        if not "!!VALS!!" in query: 
+            return (query, ())
+        q = query.replace("!!NEWLINE!!", "\n").split("!!VALS!!")
+        return (q[0], tuple(self.__backupValue(v) for v in q[1:]))
+    
+    def __backupValue(self, v):
+        if v == "!!NULL!!": return None
+        return int(v[:-len("!!INT!!")]) if v.endswith("!!INT!!") else v[1:-1]
+        
+    def __sourcePath(self, readFile):
+        return os.path.dirname(__file__) + "\\" + readFile
+    
+    def pageRows(self, table, chunkSize = None):
+        '''Yields the rows of a table as lists of tuples, chunkSize rows at a time. Each chunk is one 
+           query that continues after the last primary key of the chunk before, so no cursor stays open 
+           between chunks. A table without a primary key is streamed instead.'''
+        if chunkSize is None: chunkSize = self.batchSize
+        p = self.primaries(table)
+        if len(p) == 0:
+            s = self.query("select * from {}".format(table), stream = True, batchSize = chunkSize, mode = self.TUPLE_RESULTS, debug = False).results[2]
+            rows = list(islice(s, chunkSize))
+            while len(rows) > 0:
+                yield rows
+                rows = list(islice(s, chunkSize))
+            return
+        keys = ", ".join(p)
+        c = self.__execute("select * from {} order by {} limit {}".format(table, keys, chunkSize), None)
+        rows = c.fetchall()
+        key = [self.columns(c).index(k) for k in p]
+        after = "select * from {} where ({}) > ({}) order by {} limit {}".format(table, keys, ", ".join(["%s"]*len(p)), keys, chunkSize)
+        while len(rows) > 0:
+            yield rows
+            if len(rows) < chunkSize: break
+            c = self.__execute(after, tuple(rows[-1][i] for i in key))
+            rows = c.fetchall()
+        
+    def backupTable(self, table, chunkSize = None, progress = None, compression = None, name = None):
+        '''Backs up table to backup-<table>.txt. Rows are fetched a chunk at a time with pageRows and 
+           each chunk is handed to a BackupWriter as soon as it arrives.
+           progress - Called with the table and the number of rows written so far after each chunk.
+           compression - "gz" or "xz" writes backup-<table>.txt.gz or .txt.xz instead.
+           name - Writes the backup as if the table were called name, e.g. for a renamed copy.
+           The file is removed if the backup fails part way.'''
+        if name is None: name = table
+        bd = self.query("show columns from {}".format(table), mode = self.RECORD_RESULTS).results[2]
         c = ", ".join("{} {} {}{}".format(d["Field"], str(d["Type"])[2:-1], "null" if d["Null"] == "YES" else "not null", "" if d["Extra"] == "" else " " + d["Extra"]) for d in bd)
         p = self.primaries(table)
         if len(p) > 0: c += ", primary key ({})".format(", ".join(i for i in p))
-        s = self.query("select * from {}".format(table)).results[2]
-        for i in s: 
-            if i == "date": i["date"] = i["date"].__str__()
-        b = open("backup-{}.txt".format(table), "w+", encoding = "utf-8")
-        b.write("drop table if exists {}\n".format(table))
-        b.write("create table {} ({}) engine = INNODB\n".format(table, c))
-        for i, v in enumerate(s): 
-            b.write("insert into {} values ({})!!VALS!!{}{}".format(table, ", ".join(["%s"]*len(v)), "!!VALS!!".join(str(k) + "!!INT!!" if "int" in str(bd[j]["Type"]) else "'{}'".format(k.replace("\n", "!!NEWLINE!!")) for j, k in enumerate(v.values())), "\n" if i < len(s)-1 else ""))
+        isInt = ["int" in str(d["Type"]) for d in bd]
+        insert = "insert into {} values ({})!!VALS!!".format(name, ", ".join(["%s"]*len(bd)))
+        b = BackupWriter("backup-{}.txt".format(name), compression)
+        try:
+            try:
+                b.write("drop table if exists {}\n".format(name))
+                b.write("create table {} ({}) engine = INNODB\n".format(name, c))
+                count = 0
+                for rows in self.pageRows(table, chunkSize):
+                    b.write("".join("{}{}{}".format("" if count + i == 0 else "\n", insert, self.__backupValues(v, isInt)) for i, v in enumerate(rows)))
+                    count += len(rows)
+                    if not progress is None: progress(table, count)
+            finally:
+                b.close()
+        except:
+            if os.path.exists(b.path): os.remove(b.path)
+            raise
+        return self
+    
+    def __backupValues(self, row, isInt):
+        return "!!VALS!!".join("!!NULL!!" if k is None else str(k) + "!!INT!!" if isInt[j] else "'{}'".format(str(k).replace("\n", "!!NEWLINE!!")) 
+                               for j, k in enumerate(row))
+    
+    __TSV_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"}
+    __TSV_UNESCAPES = {"t": "\t", "n": "\n", "r": "\r", "0": "\0"}
+    
+    def __tsvValue(self, v):
+        if v is None:
+            return "\\N"
+        if isinstance(v, (bytes, bytearray)):
+            v = v.decode("utf-8")
+        return re.sub(r"[\\\t\n\r\0]", lambda m: self.__TSV_ESCAPES[m.group(0)], str(v))
+    
+    def __tsvField(self, f):
+        if f == "\\N":
+            return None
+        return re.sub(r"\\(.)", lambda m: self.__TSV_UNESCAPES.get(m.group(1), m.group(1)), f) if "\\" in f else f
+    
+    def __splitIndexes(self, create):
+        '''Splits the secondary indexes out of a show create table statement, so they can be added after a load.'''
+        lines = create.split("\n")
+        keep, indexes = ([], [])
+        for l in lines[1:-1]:
+            l = l.strip().rstrip(",")
+            if re.match(r"(unique |fulltext |spatial )?key ", l, re.I):
+                indexes.append("add " + l)
+            else:
+                keep.append(l)
+        return ("{}\n  {}\n{}".format(lines[0], ",\n  ".join(keep), lines[-1]), indexes)
+    
+    def bulkBackupTable(self, table, path = None, chunkSize = None, progress = None):
+        '''Backs up table to backup-<table>.tsv for bulkRestoreTable. The first line is a manifest 
+           comment with the create statement, the secondary indexes, the triggers and the columns, the second line 
+           has the column names and every other line is one row, tab separated with LOAD DATA escaping.
+           lastBackup then holds the table, file and number of rows written.'''
+        if path is None: path = "backup-{}.tsv".format(table)
+        return self.__writeBulk(table, path, self.pageRows(table, chunkSize), progress)
+    
+    def __writeBulk(self, table, path, chunks, progress = None):
+        self.cursor.execute("show create table {}".format(table))
+        create, indexes = self.__splitIndexes(self.cursor.fetchall()[0][1])
+        self.cursor.execute("show columns from {}".format(table))
+        cols = [c[0] for c in self.cursor.fetchall()]
+        triggers = self.__triggers(table)
+        b = open(path, "w", encoding = "utf-8", newline = "\n")
+        b.write("-- manifest: {}\n".format(json.dumps({"table": table, "create": create, "indexes": indexes, "triggers": triggers, "columns": cols})))
+        b.write("\t".join(cols) + "\n")
+        count = 0
+        for rows in chunks:
+            b.write("".join("\t".join(self.__tsvValue(v) for v in r) + "\n" for r in rows))
+            count += len(rows)
+            if not progress is None: progress(table, count)
         b.close()
+        self.lastBackup = {"table": table, "file": path, "rows": count}
+        return self
+    
+    def __triggers(self, table):
+        '''Create statements of the triggers of a table, in the order they fire, without their definer.'''
+        self.cursor.execute("select trigger_name from information_schema.triggers where trigger_schema = %s and event_object_table = %s " +
+                            "order by action_timing, event_manipulation, action_order", (self.db_name, table))
+        triggers = []
+        for (name,) in self.cursor.fetchall():
+            self.cursor.execute("show create trigger {}".format(name))
+            triggers.append(re.sub(r"DEFINER\s*=\s*\S+\s+", "", self.cursor.fetchall()[0][2], count = 1))
+        return triggers
+    
+    def bulkRestoreTable(self, table, path = None, chunkSize = None, debug = None):
+        '''Recreates a table from a bulkBackupTable file. Foreign key and unique checks are off during the 
+           load and secondary indexes are only added once the rows are in. The rows are loaded with 
+           LOAD DATA LOCAL INFILE, which needs localInfile on the connection and local_infile on the 
+           server, or else with multi-row inserts of chunkSize rows. The triggers of the table are 
+           created again once the rows are in, unless it's restored under another name. lastRestore 
+           then holds the table, file and number of rows loaded.'''
+        if debug is None: debug = self.debug
+        if path is None: path = "backup-{}.tsv".format(table)
+        with open(path, encoding = "utf-8") as f:
+            manifest = json.loads(f.readline()[len("-- manifest: "):])
+        self.__invalidate()
+        self.cursor.execute("set foreign_key_checks = 0, unique_checks = 0")
+        try:
+            self.cursor.execute("drop table if exists {}".format(table))
+            self.cursor.execute(manifest["create"].replace(manifest["table"], table, 1))
+            count = self.__loadBulk(table, path, manifest["columns"], chunkSize)
+            if len(manifest["indexes"]) > 0:
+                self.cursor.execute("alter table {} {}".format(table, ", ".join(manifest["indexes"])))
+            if table == manifest["table"]:
+                for trigger in manifest.get("triggers", []):
+                    self.cursor.execute(trigger)
+        finally:
+            self.cursor.execute("set foreign_key_checks = 1, unique_checks = 1")
+        self.lastRestore = {"table": table, "file": path, "rows": count}
+        self.results = ("Restored {} rows into {}".format(count, table), None, None)
+        return self.printResults(debug = debug)
+    
+    def __loadBulk(self, table, path, columns, chunkSize, replace = False):
+        '''Loads the rows of a bulk file into table and returns how many were loaded. 
+           replace - Rows replace existing rows with the same key.'''
+        cols = ", ".join(columns)
+        try:
+            load = "load data local infile '{}' {}into table {} character set utf8mb4 ignore 2 lines ({})"
+            self.cursor.execute(load.format(os.path.abspath(path).replace("\\", "/").replace("'", "\\'"), "replace " if replace else "", table, cols))
+            count = self.cursor.rowcount
+            self.__commit()
+        except con.Error:
+            insert = "{} into {} ({}) values ({})".format("replace" if replace else "insert", table, cols, ", ".join(["%s"]*len(columns)))
+            chunks = self.modifyMany(insert, self.__readTsv(path), chunkSize)
+            count = sum(c["rows"] for c in chunks)
+        return count
+    
+    def __watermark(self, table):
+        '''Returns the id column and highest id of a table, from manage_<table>.new_id for managed tables 
+           or else the largest value of a single integer primary key. None if it has neither.'''
+        self.cursor.execute("show tables like %s", ("manage_{}".format(table),))
+        managed = len(self.cursor.fetchall()) > 0
+        if managed:
+            self.cursor.execute("show columns from {} like %s".format(table), ("{}_id".format(table),))
+            managed = not "auto_increment" in str(self.cursor.fetchall()[0][5])
+        if managed:
+            self.cursor.execute("select new_id from manage_{}".format(table))
+            return ("{}_id".format(table), self.cursor.fetchall()[0][0])
+        p = self.primaries(table)
+        if len(p) != 1: return None
+        self.cursor.execute("select data_type from information_schema.columns where table_schema = %s and table_name = %s and column_name = %s", (self.db_name, table, p[0]))
+        if not "int" in str(self.cursor.fetchall()[0][0]): return None
+        self.cursor.execute("select coalesce(max({0}), 0) from {1}".format(p[0], table))
+        return (p[0], self.cursor.fetchall()[0][0])
+    
+    def __fingerprint(self, table, key, watermark):
+        '''Row count and xor of row crc32s up to the watermark. Any update or delete of those rows 
+           changes it, apart from the odd crc32 collision.'''
+        self.cursor.execute("show columns from {}".format(table))
+        cols = [c[0] for c in self.cursor.fetchall()]
+        row = "concat_ws(char(31), {}, {})".format(", ".join(cols), ", ".join("isnull({})".format(c) for c in cols))
+        self.cursor.execute("select count(*), coalesce(bit_xor(crc32({})), 0) from {} where {} <= %s".format(row, table, key), (watermark,))
+        return [int(v) for v in self.cursor.fetchall()[0]]
+    
+    def __rowsBetween(self, table, key, after, until, chunkSize):
+        q = "select * from {0} where {1} > %s and {1} <= %s order by {1} limit {2}".format(table, key, chunkSize)
+        while after < until:
+            c = self.__execute(q, (after, until))
+            rows = c.fetchall()
+            if len(rows) == 0: break
+            yield rows
+            after = rows[-1][self.columns(c).index(key)]
+            if len(rows) < chunkSize: break
+    
+    def incrementalBackup(self, table, path = ".", statePath = None, chunkSize = None, progress = None):
+        '''Backs up only the rows added to table since its last incremental backup. The state file, 
+           backup-state.json in path by default, keeps the highest id exported per table, its 
+           manage_<table>.new_id or integer primary key, with a row count and checksum of the rows 
+           up to it. When those rows were updated or deleted, or the table has no id to go by, the 
+           whole table is exported again. Files are in the bulkBackupTable format, a full 
+           backup-<table>.tsv followed by backup-<table>-<id>.tsv deltas. No delta is written when 
+           no rows were added, and an existing file is never written over by a delta.'''
+        if chunkSize is None: chunkSize = self.batchSize
+        if statePath is None: statePath = os.path.join(path, "backup-state.json")
+        state = {}
+        if os.path.exists(statePath):
+            with open(statePath, encoding = "utf-8") as f:
+                state = json.load(f)
+        last = state.get(table)
+        mark = self.__watermark(table)
+        full = mark is None or last is None or last["key"] != mark[0] or mark[1] < last["watermark"] or \
+               self.__fingerprint(table, mark[0], last["watermark"]) != [last["count"], last["checksum"]]
+        if full:
+            file = "backup-{}.tsv".format(table)
+            self.bulkBackupTable(table, os.path.join(path, file), chunkSize, progress)
+            files = [file]
+        elif mark[1] == last["watermark"]:
+            self.lastBackup = {"table": table, "file": None, "rows": 0}
+            files = last["files"]
+        else:
+            file, n = ("backup-{}-{}.tsv".format(table, mark[1]), 1)
+            while file in last["files"] or os.path.exists(os.path.join(path, file)):
+                file, n = ("backup-{}-{}-{}.tsv".format(table, mark[1], n), n + 1)
+            self.__writeBulk(table, os.path.join(path, file), self.__rowsBetween(table, mark[0], last["watermark"], mark[1], chunkSize), progress)
+            files = last["files"] + [file]
+        if mark is None:
+            state.pop(table, None)
+        else:
+            count, checksum = self.__fingerprint(table, mark[0], mark[1])
+            state[table] = {"key": mark[0], "watermark": mark[1], "count": count, "checksum": checksum, "files": files}
+        with open(statePath, "w", encoding = "utf-8") as f:
+            json.dump(state, f, indent = 2)
+        self.lastBackup["full"] = full
+        self.results = ("{} backup of {}: {} rows".format("Full" if full else "Incremental", table, self.lastBackup["rows"]), None, None)
+        return self
+    
+    def incrementalRestore(self, table, path = ".", statePath = None, chunkSize = None, debug = None):
+        '''Restores a table from its incrementalBackup files: the full backup, then every delta.'''
+        if debug is None: debug = self.debug
+        if statePath is None: statePath = os.path.join(path, "backup-state.json")
+        with open(statePath, encoding = "utf-8") as f:
+            files = json.load(f)[table]["files"]
+        self.bulkRestoreTable(table, os.path.join(path, files[0]), chunkSize, debug = False)
+        count = self.lastRestore["rows"]
+        for file in files[1:]:
+            file = os.path.join(path, file)
+            with open(file, encoding = "utf-8") as f:
+                columns = json.loads(f.readline()[len("-- manifest: "):])["columns"]
+            count += self.__loadBulk(table, file, columns, chunkSize, replace = True)
+        self.__invalidate()
+        self.results = ("Restored {} rows into {} from {} files".format(count, table, len(files)), None, None)
+        return self.printResults(debug = debug)
+    
+    def __readTsv(self, path):
+        with open(path, encoding = "utf-8", newline = "\n") as f:
+            for i, line in enumerate(f):
+                if i > 1:
+                    yield [self.__tsvField(v) for v in line.rstrip("\n").split("\t")]
+    
+    def tableLevels(self, tables = None):
+        '''Orders tables by their foreign keys. Returns a list of levels, where the tables of a level 
+           only reference tables of earlier levels and can be backed up or restored together. 
+           Tables in a reference cycle share the last level.'''
+        if tables is None:
+            tables = [r[0] for r in self.query("show full tables where table_type <> 'VIEW'", mode = self.TUPLE_RESULTS).results[2]]
+        refs = {t: set() for t in tables}
+        for (t, r) in self.__referenceRows():
+            if t in refs and r in refs and r != t:
+                refs[t].add(r)
+        levels, done = ([], set())
+        while len(done) < len(tables):
+            level = [t for t in tables if not t in done and refs[t] <= done]
+            if len(level) == 0:
+                level = [t for t in tables if not t in done]
+            levels.append(level)
+            done.update(level)
+        return levels
+    
+    def __referenceRows(self):
+        c = self.__execute("select table_name, referenced_table_name from information_schema.key_column_usage " + 
+                           "where table_schema = %s and referenced_table_name is not null", (self.db_name,))
+        return c.fetchall()
+    
+    def __hashFile(self, path):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for b in iter(lambda: f.read(1 << 20), b""):
+                h.update(b)
+        return h.hexdigest()
+    
+    def __runLevels(self, levels, work, pool, workers):
+        '''Runs work(db, table) for every table, a level at a time. With a pool the tables of a level run 
+           at once on up to workers connections, otherwise one after another on this connection.'''
+        def run(table):
+            db = PySql(pool = pool)
+            try:
+                return work(db, table)
+            finally:
+                db.close()
+        done = {}
+        for level in levels:
+            if pool is None or len(level) == 1:
+                for t in level:
+                    done[t] = work(self, t)
+            else:
+                with ThreadPoolExecutor(max_workers = min(len(level), workers or pool.maxSize)) as e:
+                    done.update(zip(level, e.map(run, level)))
+        return done
+    
+    def backupSchema(self, path = "backup", pool = None, workers = None, chunkSize = None, progress = None):
+        '''Backs up every table of the database into the path folder with bulkBackupTable, in foreign key 
+           order, and writes backup-schema.json with the levels, row counts and sha256 checksums.
+           pool - Backs up the tables of a level at once on connections from this pool. 
+                  Defaults to the pool of this connection.
+           workers - Most tables backed up at once. Defaults to the size of the pool.'''
+        if pool is None: pool = self.pool
+        os.makedirs(path, exist_ok = True)
+        levels = self.tableLevels()
+        def work(db, table):
+            file = os.path.join(path, "backup-{}.tsv".format(table))
+            db.bulkBackupTable(table, file, chunkSize, progress)
+            return {"file": os.path.basename(file), "rows": db.lastBackup["rows"], "sha256": self.__hashFile(file)}
+        tables = self.__runLevels(levels, work, pool, workers)
+        with open(os.path.join(path, "backup-schema.json"), "w", encoding = "utf-8") as f:
+            json.dump({"database": self.db_name, "levels": levels, "tables": tables}, f, indent = 2)
+        self.results = ("Backed up {} tables to {}".format(len(tables), path), ["table", "rows", "sha256"],
+                        [(t, m["rows"], m["sha256"]) for (t, m) in tables.items()])
         return self
     
-    def createTable(self, table, outFile = "", printText = True, debug = None, setForeignKeyChecks = False):  
+    def restoreSchema(self, path = "backup", pool = None, workers = None, chunkSize = None, debug = None):
+        '''Restores the tables of a backupSchema folder level by level with bulkRestoreTable. A table 
+           whose file doesn't match its checksum isn't restored and is reported in the results.'''
+        if debug is None: debug = self.debug
+        if pool is None: pool = self.pool
+        with open(os.path.join(path, "backup-schema.json"), encoding = "utf-8") as f:
+            manifest = json.load(f)
+        self.__invalidate()
+        def work(db, table):
+            m = manifest["tables"][table]
+            file = os.path.join(path, m["file"])
+            if self.__hashFile(file) != m["sha256"]:
+                return "checksum mismatch"
+            db.bulkRestoreTable(table, file, chunkSize, debug = False)
+            return db.results[0]
+        tables = self.__runLevels(manifest["levels"], work, pool, workers)
+        self.results = ("Restored {} tables from {}".format(len(tables), path), ["table", "result"], list(tables.items()))
+        return self.printResults(debug = debug)
+    
+    def createTable(self, table, outFile = "", printText = True, debug = None, setForeignKeyChecks = False, bulk = False):  
+        '''Restores a table from its backupTable file, the newest of backup-<table>.txt, .txt.gz and .txt.xz, 
+           or from its bulkBackupTable file if bulk is set.'''
         if debug is None: debug = self.debug
+        if bulk: return self.bulkRestoreTable(table, debug = debug)
+        files = ["backup-{}.txt{}".format(table, e) for e in BackupWriter.EXTENSIONS.values()]
+        files = [f for f in files if os.path.exists(self.__sourcePath(f))]
+        readFile = max(files, key = lambda f: os.path.getmtime(self.__sourcePath(f))) if len(files) > 0 else "backup-{}.txt".format(table)
         if setForeignKeyChecks: self.setForeignKeyChecks(0)
-        self.source("backup-{}.txt".format(table), outFile, printText, debug) 
+        self.source(readFile, outFile, printText, debug) 
         if setForeignKeyChecks: self.setForeignKeyChecks(1)
         return self
     
@@ -292,15 +1491,64 @@ class PySql:
         self.cursor.execute("set foreign_key_checks = {}".format(c))
         return self
         
-    def truncate(self, table, debug = None):
-        '''Truncates, or clears all data from the table.'''
+    def truncate(self, table, debug = None, fast = False, backup = True):
+        '''Truncates, or clears all data from the table, after backing it up with backupTable.
+           fast - Swaps in an empty copy of the table at once with create table like and rename table, 
+                  then backs up and drops the old table on another connection. lastTruncate is the 
+                  BackgroundTask doing it, so lastTruncate.wait() waits for the backup. The table's 
+                  foreign keys are added to the copy and its triggers are moved over, so inserts run 
+                  between the swap and the triggers moving skip them. A table that any foreign key 
+                  references is truncated in place instead, since the key would follow the rename.
+           backup - Backs up the table first. Without it the old table is only dropped.'''
         if debug is None: debug = self.debug
-        self.backupTable(table)
+        self.lastTruncate = None
+        if fast and not self.__isReferenced(table):
+            return self.__swapTruncate(table, debug, backup)
+        if backup: self.backupTable(table)
         t = "truncate {}".format(table)
+        self.__invalidate(t)
         self.cursor.execute(t)
-        if debug: print(t)
+        if debug: self.logger.info(t)
         return self
     
+    def __isReferenced(self, table):
+        self.cursor.execute("select count(*) from information_schema.key_column_usage where table_schema = %s and " + 
+                            "referenced_table_name = %s", (self.db_name, table))
+        return self.cursor.fetchall()[0][0] > 0
+    
+    def __swapTruncate(self, table, debug, backup):
+        stamp = int(time.time()*1000)
+        old, new = ("{}_truncated_{}".format(table, stamp), "{}_empty_{}".format(table, stamp))
+        self.cursor.execute("show create table {}".format(table))
+        keys = [l.strip().rstrip(",") for l in self.cursor.fetchall()[0][1].split("\n") if "foreign key" in l.lower()]
+        keys = ["add " + re.sub(r"^constraint `?\w+`?\s+", "", k, flags = re.I) for k in keys]
+        self.cursor.execute("select trigger_name from information_schema.triggers where trigger_schema = %s and " + 
+                            "event_object_table = %s order by action_order", (self.db_name, table))
+        triggers = []
+        for (name,) in self.cursor.fetchall():
+            self.cursor.execute("show create trigger {}".format(name))
+            triggers.append((name, self.cursor.fetchall()[0][2]))
+        self.cursor.execute("create table {} like {}".format(new, table))
+        if len(keys) > 0: self.cursor.execute("alter table {} {}".format(new, ", ".join(keys)))
+        self.__invalidate()
+        for (name, _) in triggers:
+            self.cursor.execute("drop trigger {}".format(name))
+        self.cursor.execute("rename table {0} to {1}, {2} to {0}".format(table, old, new))
+        for (_, create) in triggers:
+            self.cursor.execute(create)
+        if debug: self.logger.info("truncate {} (swapped out to {})".format(table, old))
+        self.lastTruncate = BackgroundTask(self.__dropTruncated, old, table, backup)
+        return self
+    
+    def __dropTruncated(self, old, table, backup):
+        db = PySql(pool = self.pool) if not self.pool is None else PySql(**self.__connect)
+        try:
+            if backup: db.backupTable(old, name = table)
+            db.cursor.execute("drop table {}".format(old))
+        finally:
+            db.close()
+        return old
+    
     def showTables(self):
         self.query("show full tables where table_type <> 'VIEW'")
         return self
@@ -322,15 +1570,66 @@ class PySql:
         return self
     
     def callProcedure(self, query, procName, *args):
+        '''Calls a stored procedure. OUT and INOUT parameter values are kept in procedureArgs.
+           Result sets selected by the procedure are kept in procedureResults and the last one 
+           becomes results, so a procedure that ends by selecting the new row needs no follow up query. 
+           A procedure that selects nothing leaves ("call <procName>", None, None) in results.
+           query - Runs after the call with args, like before procedures returned their rows.'''
+        self.__invalidate()
+        self.procedureResults = []
         try:
-            self.cursor.callproc(procName, args)
-            self.db.commit()
+            self.procedureArgs = tuple(self.cursor.callproc(procName, args))
+            for r in self.cursor.stored_results():
+                cols = tuple(r.column_names)
+                self.procedureResults.append(("call {}".format(procName), cols, self.__rows(cols, r.fetchall(), self.resultMode)))
+            self.__commit()
+            if len(self.procedureResults) > 0:
+                self.results = self.procedureResults[-1]
+                if query is None: self.printResults(debug = self.debug)
+            else:
+                self.results = ("call {}".format(procName), None, None)
             if not query is None:
                 self.setArgs(*args).query(query)
         except con.Error as e:
+            self.__fail()
             self.results = (self.__checkError(e.msg), None, None)
         return self
         
+    def reserveIds(self, table, n):
+        '''Reserves n consecutive ids of a managed table with reserve_<table>_ids. Returns the first 
+           and last id, or None with the error in results.'''
+        self.procedureArgs = ()
+        self.callProcedure(None, "reserve_{}_ids".format(table), n, 0, 0)
+        return None if len(self.procedureArgs) < 3 else tuple(self.procedureArgs[1:])
+    
+    def bulkInsert(self, table, rows, chunkSize = None):
+        '''Inserts rows given without their <table>_id with modifyMany. A managed table gets the ids of 
+           every row from one reserveIds call, so its insert trigger doesn't update manage_<table> for 
+           each row, and lastIds holds the range. The reservation and the inserts are one transaction, 
+           so a failed chunk rolls back every row and the reserved ids, and leaves lastIds None. 
+           An auto_increment table numbers the rows itself. Returns the chunks of modifyMany.'''
+        rows = [tuple(r) for r in rows]
+        key = "{}_id".format(table)
+        self.cursor.execute("show columns from {}".format(table))
+        columns = self.cursor.fetchall()
+        auto = any(c[0] == key and "auto_increment" in str(c[5]) for c in columns)
+        columns = [c[0] for c in columns if c[0] != key]
+        self.lastIds = None
+        if len(rows) == 0: return []
+        insert = "insert into {} ({}, {}) values ({})".format(table, key, ", ".join(columns), ", ".join(["%s"]*(len(columns)+1)))
+        if auto:
+            return self.modifyMany(insert, ((None,) + r for r in rows), chunkSize)
+        with self.transaction():
+            self.lastIds = self.reserveIds(table, len(rows))
+            if self.lastIds is None: 
+                return [{"chunk": 1, "rows": 0, "error": self.results[0]}]
+            ids = range(self.lastIds[0], self.lastIds[1] + 1)
+            chunks = self.modifyMany(insert, ((i,) + r for (i, r) in zip(ids, rows)), chunkSize)
+        if self.lastTransactionRolledBack:
+            self.lastIds = None
+            for c in chunks: c["rows"] = 0
+        return chunks
+    
     def callFunction(self, query, *args):
         try:
             self.__function = True
@@ -341,7 +1640,14 @@ class PySql:
         return self
     
     def close(self):
-        self.db.close()
+        self.__endStream()
+        self.closeResults()
+        self.__closePrepared()
+        if self.pool is None:
+            self.db.close()
+        else:
+            self.cursor.close()
+            self.pool.release(self.db)
       
 class SshSql(PySql):
     def __init__(self, ssh_host, ssh_user, ssh_password, db_user, db_password, database, debug = False):
@@ -365,6 +1671,17 @@ class AccessSql(SshSql, PySql):
     SSH_ACCESS = "ssh"
     
     def __init__(self, debug = False, path = "access.txt", accessType = PY_ACCESS, decode = None):
+        access = self.readAccess(path, decode)
+        access["debug"] = debug
+        self.__access = {self.PY_ACCESS: PySql, self.SSH_ACCESS: SshSql}[accessType]
+        try:
+            self.__access.__init__(self, **access)
+        except:
+            sys.exit("Accessing connection failed.")
+      
+    @staticmethod
+    def readAccess(path = "access.txt", decode = None):
+        '''Reads the "key: value" connection settings of an access file.'''
         access = {}
         with open(path, encoding = "utf-8") as f:
             for line in f:
@@ -373,24 +1690,175 @@ class AccessSql(SshSql, PySql):
                     if "password" in key.lower():
                         val = decode(val).text()
                 access[key] = val
-        access["debug"] = debug
-        self.__access = {self.PY_ACCESS: PySql, self.SSH_ACCESS: SshSql}[accessType]
-        try:
-            self.__access.__init__(self, **access)
-        except:
-            sys.exit("Accessing connection failed.")
+        return access
       
     def close(self):
         try:
             self.__access.close(self)
         except:
             pass
+        
+class BackgroundTask:
+    '''Runs target(*args) on a thread. wait returns what it returned or raises what it raised.'''
+    def __init__(self, target, *args):
+        self.result = None
+        self.error = None
+        self.__thread = threading.Thread(target = self.__run, args = (target, args), daemon = True)
+        self.__thread.start()
+        
+    def __run(self, target, args):
+        try:
+            self.result = target(*args)
+        except BaseException as e:
+            self.error = e
+            
+    def done(self):
+        return not self.__thread.is_alive()
+    
+    def wait(self, timeout = None):
+        '''Waits for the task, at most timeout seconds if given.'''
+        self.__thread.join(timeout)
+        if not self.error is None: raise self.error
+        return self.result
+    
+class ConnectionPool:
+    '''Shares mysql connections between PySql objects, e.g. PySql(pool = pool), and worker threads.
+       maxSize - Most connections open at once. checkout waits for one to be released after that.
+       idleTimeout - Seconds a released connection is kept before it is closed.
+       timeout - Seconds checkout waits for a connection. None waits forever.'''
+    def __init__(self, host, user, password, database, port = 3306, maxSize = 5, idleTimeout = 300, timeout = None, localInfile = False):
+        self.__connect = {"host": host, "port": port, "user": user, "password": password, "database": database, "allow_local_infile": localInfile}
+        self.database = database
+        self.maxSize = maxSize
+        self.idleTimeout = idleTimeout
+        self.timeout = timeout
+        self.__idle = []
+        self.__size = 0
+        self.__closed = False
+        self.__lock = threading.Condition()
+        
+    @classmethod
+    def fromAccess(cls, path = "access.txt", decode = None, **options):
+        '''Creates a pool from the host, user, password and database of an access file.'''
+        access = AccessSql.readAccess(path, decode)
+        access = {k: access[k] for k in ("host", "user", "password", "database") if k in access}
+        return cls(**access, **options)
+    
+    def __closeIdle(self):
+        now = time.monotonic()
+        idle = []
+        for (c, released) in self.__idle:
+            if now - released > self.idleTimeout:
+                self.__size -= 1
+                try:
+                    c.close()
+                except con.Error:
+                    pass
+            else:
+                idle.append((c, released))
+        self.__idle = idle
+        
+    def __open(self):
+        try:
+            return con.connect(**self.__connect)
+        except con.Error:
+            connect = dict(self.__connect)
+            connect.pop("database")
+            c = con.connect(**connect)
+            cursor = c.cursor()
+            cursor.execute("set sql_notes = 0")
+            cursor.execute("create database if not exists {}".format(self.database))
+            cursor.execute("use {}".format(self.database))
+            cursor.close()
+            return c
+        
+    def __validate(self, c):
+        try:
+            c.ping(reconnect = False)
+            return c
+        except con.Error:
+            try:
+                c.close()
+            except con.Error:
+                pass
+            return self.__open()
+    
+    def checkout(self):
+        '''Returns an idle connection that answers a ping, or opens a new one if the pool isn't full.'''
+        end = None if self.timeout is None else time.monotonic() + self.timeout
+        with self.__lock:
+            while True:
+                if self.__closed:
+                    raise con.PoolError("Connection pool is closed.")
+                self.__closeIdle()
+                if len(self.__idle) > 0:
+                    c = self.__idle.pop()[0]
+                    break
+                if self.__size < self.maxSize:
+                    self.__size += 1
+                    c = None
+                    break
+                wait = None if end is None else end - time.monotonic()
+                if not wait is None and wait <= 0:
+                    raise con.PoolError("No connection became available within {} seconds.".format(self.timeout))
+                self.__lock.wait(wait)
+        try:
+            return self.__open() if c is None else self.__validate(c)
+        except con.Error:
+            with self.__lock:
+                self.__size -= 1
+                self.__lock.notify()
+            raise
+        
+    def release(self, c):
+        '''Gives a connection back to the pool. Uncommitted work is rolled back.'''
+        with self.__lock:
+            try:
+                if self.__closed or not c.is_connected():
+                    raise con.Error("Connection is closed.")
+                c.rollback()
+                self.__idle.append((c, time.monotonic()))
+            except con.Error:
+                self.__size -= 1
+                try:
+                    c.close()
+                except con.Error:
+                    pass
+            self.__lock.notify()
+            
+    @contextmanager
+    def connection(self):
+        '''with pool.connection() as (connection, cursor): ...'''
+        c = self.checkout()
+        cursor = None
+        try:
+            cursor = c.cursor()
+            yield (c, cursor)
+        finally:
+            if not cursor is None: cursor.close()
+            self.release(c)
+            
+    def close(self):
+        '''Closes idle connections. Connections still checked out are closed when released.'''
+        with self.__lock:
+            self.__closed = True
+            for (c, _) in self.__idle:
+                self.__size -= 1
+                try:
+                    c.close()
+                except con.Error:
+                    pass
+            self.__idle = []
+            self.__lock.notify_all()
       
 class ExecuteSql:
-    def __init__(self, title, db = None, printText = True, debug = False, path = "access.txt", accessType = AccessSql.PY_ACCESS):
+    MANAGED_IDS = "managed"
+    AUTO_INCREMENT_IDS = "auto_increment"
+    
+    def __init__(self, title, db = None, printText = True, debug = False, path = "access.txt", accessType = AccessSql.PY_ACCESS, pool = None):
         if db is None:
             try:
-                self.db = AccessSql(debug, path, accessType)
+                self.db = AccessSql(debug, path, accessType) if pool is None else PySql(debug = debug, pool = pool)
             except SystemExit as e:
                 print(e)
                 quit()
@@ -403,6 +1871,9 @@ class ExecuteSql:
         self.printText = printText
         self.debug = debug
         self.maintainDatabase(False)
+        self.setIdStrategy(self.MANAGED_IDS)
+        self.setStaticStatements(False)
+        self.setMigration(False)
         print(self.title)
            
     def printResults(self, q, index = None):
@@ -420,18 +1891,25 @@ class ExecuteSql:
         return q.__str__()
         
     def createProcedure(self, name, args, code, index):
-        self.db.cursor.execute("drop procedure if exists {}".format(name))
         q = WriteSql()
         q.append("create procedure {}({})".format(name, args))
         if isinstance(code, WriteSql):
             code.separator = ";\n\t\t"
         q = self.begin_method(q, code)
-        self.printResults(q, index)
-        self.db.cursor.execute(q)
-        return index + 1
+        return self.sendCreate("procedure", name, q, index)
+         
+    def returnSelect(self, code, select):
+        '''Ends a procedure's code with a select, so callProcedure gets the row back in the same round trip.'''
+        if len(code.code) > 0 and code.code[-1][-1:] == ";":
+            code.code[-1] = code.code[-1][:-1]
+        code.append("{};".format(select))
+        return code
+         
+    def createView(self, name, select, index):
+        q = "create or replace view {} as {}".format(name, select)
+        return self.sendCreate("view", name, q, index)
          
     def createFunction(self, name, args, returnType, code, index):
-        self.db.cursor.execute("drop function if exists {}".format(name))
         q = WriteSql()
         q.append("create function {}({}) returns {}".format(name, args, returnType))
         if isinstance(code, WriteSql):
@@ -439,9 +1917,7 @@ class ExecuteSql:
         q.append("not deterministic")
         q.append("reads sql data")
         q = self.begin_method(q, code)
-        self.printResults(q, index)
-        self.db.cursor.execute(q)
-        return index + 1
+        return self.sendCreate("function", name, q, index)
     
     def checkString(self, check, find, isEqual = True, isEnd = False):
         check = check[-len(find):] if isEnd else check[:len(find)]
@@ -464,8 +1940,139 @@ class ExecuteSql:
         args = ", ".join([" ".join(a) for a in args])
         return self.createProcedure(name, args, prep, index)
     
-    def maintainDatabase(self, maintain):
+    def setIdStrategy(self, strategy, slots = 16):
+        '''How managed tables get their ids.
+           MANAGED_IDS - A before insert trigger takes the next id from the one row of manage_<table>, 
+                         so concurrent inserts into a table wait on that row.
+           AUTO_INCREMENT_IDS - The id column is auto_increment. manage_<table>_id() returns the last id 
+                                the connection inserted and the size is kept in slots rows of 
+                                manage_<table>, one per connection_id() % slots, added up by manage_<table>_size().'''
+        if not strategy in (self.MANAGED_IDS, self.AUTO_INCREMENT_IDS):
+            raise ValueError("Unknown id strategy {}.".format(strategy))
+        self.idStrategy = strategy
+        self.idSlots = slots
+        return self
+    
+    def isAutoIncrement(self):
+        return self.idStrategy == self.AUTO_INCREMENT_IDS
+    
+    def setMigration(self, migrate = True):
+        '''Migrates the database in place instead of building it again. CreateSql alters existing 
+           tables to match their definitions, and procedures, functions, triggers and views whose 
+           create statement is the one recorded in schema_objects are left alone. recordSchemaVersion 
+           then adds the schema_version row for all of them.'''
+        self.isMigrating = migrate
+        self.__migrationReady = False
+        return self
+    
+    def migrationState(self):
+        '''Migration state kept on self.db, so every builder sharing the connection adds to it: the 
+           number of changes sent, a checksum of every create statement and the objects sent.'''
+        if getattr(self.db, "migrationState", None) is None:
+            self.db.migrationState = {"changes": 0, "schema": hashlib.sha256(), "sent": set()}
+        return self.db.migrationState
+    
+    def recordSchemaVersion(self):
+        '''Drops the procedures, functions, triggers and views recorded in schema_objects that no 
+           builder sent this run, then adds a row to schema_version when the migration changed 
+           something or the definitions did. Call it once, after the last builder.'''
+        if not self.isMigrating: return self
+        state = self.migrationState()
+        checksum = state["schema"].hexdigest()
+        self.migrationTables()
+        self.db.cursor.execute("select kind, name from schema_objects")
+        for (kind, name) in self.db.cursor.fetchall():
+            if not (kind, name) in state["sent"]:
+                self.printResults("drop {} if exists {}".format(kind, name))
+                self.db.cursor.execute("drop {} if exists {}".format(kind, name))
+                self.db.cursor.execute("delete from schema_objects where kind = %s and name = %s", (kind, name))
+                state["changes"] += 1
+        self.db.cursor.execute("select checksum from schema_version order by version desc limit 1")
+        if state["changes"] > 0 or self.db.cursor.fetchall() != [(checksum,)]:
+            self.db.cursor.execute("insert into schema_version (checksum, changes, applied_at) values (%s, %s, now())", (checksum, state["changes"]))
+        self.db.db.commit()
+        self.db.migrationState = None
+        return self
+    
+    def migrationTables(self):
+        '''Creates schema_version, a row for each migration of the schema, and schema_objects, 
+           the checksum of the create statement of each routine, trigger and view.'''
+        if self.__migrationReady: return self
+        q = WriteSql().setNull(False)
+        q.append("version int not null auto_increment")
+        q.setColumns("char(64)", "checksum")
+        q.setColumns("int", "changes")
+        q.setColumns("datetime", "applied_at")
+        q.setKeys("primary", "version")
+        q.separator = ",\n\t"
+        self.db.cursor.execute("create table if not exists schema_version (\n\t{}\n) engine = INNODB".format(q))
+        q = WriteSql().setNull(False)
+        q.setColumns("varchar(16)", "kind")
+        q.setColumns("varchar(64)", "name")
+        q.setColumns("char(64)", "checksum")
+        q.setColumns("datetime", "updated_at")
+        q.setKeys("primary", "kind", "name")
+        q.separator = ",\n\t"
+        self.db.cursor.execute("create table if not exists schema_objects (\n\t{}\n) engine = INNODB".format(q))
+        self.__migrationReady = True
+        return self
+    
+    def __exists(self, kind, name):
+        if kind == "trigger":
+            q = "select count(*) from information_schema.triggers where trigger_schema = %s and trigger_name = %s"
+        elif kind == "view":
+            q = "select count(*) from information_schema.views where table_schema = %s and table_name = %s"
+        else:
+            q = "select count(*) from information_schema.routines where routine_schema = %s and routine_name = %s and routine_type = '{}'".format(kind.upper())
+        self.db.cursor.execute(q, (self.db.db_name, name))
+        return self.db.cursor.fetchall()[0][0] > 0
+    
+    def sendCreate(self, kind, name, q, index):
+        '''Drops and creates a procedure, function, trigger or view. While migrating, one that exists 
+           with the same create statement as last time is left alone.'''
+        self.printResults(q, index)
+        if self.isMigrating:
+            self.migrationState()["schema"].update(q.encode("utf-8"))
+            self.migrationState()["sent"].add((kind, name))
+            checksum = hashlib.sha256(q.encode("utf-8")).hexdigest()
+            self.migrationTables()
+            self.db.cursor.execute("select checksum from schema_objects where kind = %s and name = %s", (kind, name))
+            if self.db.cursor.fetchall() == [(checksum,)] and self.__exists(kind, name):
+                return index + 1
+        self.db.queue("drop {} if exists {}".format(kind, name))
+        self.db.queue(q).executeBatch(debug = False, raiseError = True)
+        if self.isMigrating:
+            self.migrationState()["changes"] += 1
+            self.db.cursor.execute("replace into schema_objects values (%s, %s, %s, now())", (kind, name, checksum))
+            self.db.db.commit()
+        return index + 1
+    
+    def setStaticStatements(self, use = True):
+        '''Calls the insert_<table> and set_<table>_<column> procedures of StaticStatements from 
+           insertCall and updateCall, instead of the prepared statement procedures.'''
+        self.staticStatements = use
+        return self
+    
+    def insertCall(self, prepared, table, *values, idValue = None):
+        '''Code calling an insert procedure. prepared names the PreparedInsertStatements procedure, 
+           which fills in the id itself, and idValue is the id given first to the static one.'''
+        if self.staticStatements:
+            if not idValue is None: values = (str(idValue),) + values
+            return "call insert_{}({})".format(table, ", ".join(values))
+        return "call {}('{}', {})".format(prepared, table, ", ".join(values))
+    
+    def updateCall(self, prepared, table, column, value):
+        '''Code calling an update procedure that sets column for every row of table.'''
+        if self.staticStatements:
+            return "call set_{}_{}({})".format(table, column, value)
+        return "call {}('{}', '{}', {})".format(prepared, table, column, value)
+    
+    def maintainDatabase(self, maintain, inServer = True):
+        '''maintain - Keeps the rows of the tables when the database is rebuilt.
+           inServer - Keeps them on the server by moving the old tables to <database>_maintained and 
+                      copying them back with insert ... select, instead of reading them into Python.'''
         self.isMaintained = maintain
+        self.maintainInServer = inServer
     
 class CreateSql(ExecuteSql):
     VERTICAL_SCROLLBAR = "vertical"
@@ -478,89 +2085,238 @@ class CreateSql(ExecuteSql):
     
     def __init__(self, db = None, printText = True, debug = False, execute = ExecuteSql):
         execute.__init__(self, "creates", db, printText, debug)
+        self.__maintained = None
         
     def dropCreateDatabase(self, database = None):
+        '''Drops and creates the database, or only creates it if it's missing while migrating.'''
         if not database is None:
-            if self.isMaintained:
-                self.db.showTables()
+            self.__maintained = None
+            if self.isMigrating:
+                self.db.cursor.execute("create database if not exists {}".format(database))
+                self.db.use(database, debug = False)
+                self.migrationTables()
+                return
+            if self.isMaintained and self.maintainInServer:
+                self.__moveToMaintained(database)
+            elif self.isMaintained:
+                self.db.query("show full tables where table_type <> 'VIEW'", mode = PySql.RECORD_RESULTS)
                 tables = self.db.results[2]
                 tables = [table["Tables_in_{}".format(self.db.db_name)] for table in tables]
                 tableRows = []
                 for t in tables:
-                    self.db.query("select * from {}".format(t))
+                    self.db.query("select * from {}".format(t), mode = PySql.RECORD_RESULTS)
                     tableRows.append(self.db.results[2])
                 self.__backup = dict(zip(tables, tableRows))
             self.db.cursor.execute("drop database if exists {}".format(database))
             self.db.cursor.execute("create database {}".format(database))
             self.db.use(database, debug = False)
             
+    def __moveToMaintained(self, database):
+        '''Moves the tables of database into <database>_maintained with one rename table, so no rows 
+           leave the server. MySQL can't rename a database, so tables are moved instead. Triggers 
+           are dropped first since a table can't change database with them, and are created again 
+           with the rest of the schema. A <database>_maintained left by an earlier rebuild may hold 
+           the only copy of rows, so the rebuild stops until dropMaintainedBackup drops it.'''
+        shadow = "{}_maintained".format(database)
+        self.__maintained = set()
+        self.db.cursor.execute("select count(*) from information_schema.schemata where schema_name = %s", (shadow,))
+        if self.db.cursor.fetchall()[0][0] > 0:
+            raise con.Error(msg = "{0} is still there from an earlier rebuild. Check it and call dropMaintainedBackup first.".format(shadow))
+        self.db.cursor.execute("select table_name from information_schema.tables where table_schema = %s and table_type = 'BASE TABLE'", (database,))
+        tables = [t[0] for t in self.db.cursor.fetchall()]
+        if len(tables) == 0: return
+        self.db.cursor.execute("select trigger_name from information_schema.triggers where trigger_schema = %s", (database,))
+        for (trigger,) in self.db.cursor.fetchall():
+            self.db.cursor.execute("drop trigger {}.{}".format(database, trigger))
+        self.db.cursor.execute("create database {}".format(shadow))
+        self.db.cursor.execute("rename table {}".format(", ".join("{0}.{2} to {1}.{2}".format(database, shadow, t) for t in tables)))
+        self.__maintained = set(tables)
+        
+    def dropMaintainedBackup(self, database = None):
+        '''Drops <database>_maintained, the old tables kept by a rebuild in the server, once the new 
+           database is checked. Defaults to the database in use.'''
+        if database is None: database = self.db.db_name
+        self.db.cursor.execute("drop database if exists {}_maintained".format(database))
+        return self
+        
+    def __copyMaintained(self, table):
+        shadow = "{}_maintained".format(self.db.db_name)
+        q = "select column_name from information_schema.columns where table_schema = %s and table_name = %s"
+        self.db.cursor.execute(q, (shadow, table))
+        old = set(c[0] for c in self.db.cursor.fetchall())
+        self.db.cursor.execute(q + " order by ordinal_position", (self.db.db_name, table))
+        columns = ", ".join(c[0] for c in self.db.cursor.fetchall() if c[0] in old)
+        self.db.setForeignKeyChecks(0)
+        try:
+            self.db.cursor.execute("insert into {0} ({1}) select {1} from {2}.{0}".format(table, columns, shadow))
+            self.db.db.commit()
+        finally:
+            self.db.setForeignKeyChecks(1)
+        
     def __maintainTable(self, table):
+        if not self.__maintained is None:
+            if table in self.__maintained: self.__copyMaintained(table)
+            return
         rows = self.__backup[table]
         if len(rows) > 0:
-            for r in rows:
-                values = tuple(r.values())
-                questions = ", ".join(["%s"]*len(values))
-                query = "insert into {} values ({})".format(table, questions)
-                self.db.modify(query, *values)
+            questions = ", ".join(["%s"]*len(rows[0]))
+            query = "insert into {} values ({})".format(table, questions)
+            self.db.modifyMany(query, (r.values() for r in rows))
         self.db.query("select * from {}".format(table))
           
     def start(self):
         table = "manage_columns"
-        q = "drop table if exists {}".format(table)
-        self.db.cursor.execute(q)
         q = WriteSql().setNull(False)
         q.setColumns("varchar(255)", "table_name", "column_questions")
         q.setKeys("index", "table_name", "column_questions")
         q.separator = ",\n\t"
         q = "create table {} (\n\t{}\n) engine = INNODB".format(table, q)
-        self.printResults(q, 1)
-        self.db.cursor.execute(q)
-        if self.isMaintained:
+        self.__sendTable(table, q, 1)
+        if self.isMaintained and not self.isMigrating:
             self.__maintainTable(table)
         self.execute(2)
         
+    def __sendTable(self, table, q, index):
+        '''Drops and creates a table, or while migrating alters the existing one to match q. 
+           Returns whether the table is new.'''
+        if self.isMigrating:
+            self.migrationState()["schema"].update(q.encode("utf-8"))
+            return self.__migrateTable(table, q, index)
+        self.printResults(q, index)
+        self.db.queue("drop table if exists {}".format(table))
+        self.db.queue(q).executeBatch(debug = False, raiseError = True)
+        return True
+    
+    def __migrateTable(self, table, create, index):
+        '''Creates the table if it's missing, or else compares it with a scratch table made from create 
+           and sends only the alter statements needed to match it, so its rows stay where they are.'''
+        self.db.cursor.execute("show tables like %s", (table,))
+        if len(self.db.cursor.fetchall()) == 0:
+            self.printResults(create, index)
+            self.db.queue(create).executeBatch(debug = False, raiseError = True)
+            self.migrationState()["changes"] += 1
+            return True
+        scratch = "migrate_{}".format(table)
+        self.db.cursor.execute("drop table if exists {}".format(scratch))
+        self.db.cursor.execute(create.replace("create table {} (".format(table), "create table {} (".format(scratch), 1))
+        try:
+            want = self.__definition(scratch)
+        finally:
+            self.db.cursor.execute("drop table {}".format(scratch))
+        alters = self.__alters(table, self.__definition(table), want)
+        self.db.setForeignKeyChecks(0)
+        try:
+            for q in alters:
+                self.printResults(q, index)
+                self.db.cursor.execute(q)
+        finally:
+            self.db.setForeignKeyChecks(1)
+        self.migrationState()["changes"] += len(alters)
+        return False
+    
+    def __definition(self, table):
+        '''Columns, primary key, keys and foreign keys from show create table, with the key and 
+           constraint names left out so they compare between tables.'''
+        self.db.cursor.execute("show create table {}".format(table))
+        lines = [l.strip().rstrip(",") for l in self.db.cursor.fetchall()[0][1].split("\n")[1:-1]]
+        columns = OrderedDict((re.match(r"`(\w+)`", l).group(1), l) for l in lines if l.startswith("`"))
+        primary = next((l for l in lines if l.startswith("PRIMARY KEY")), None)
+        keys, foreign = ({}, {})
+        for l in lines:
+            k = re.match(r"((?:UNIQUE |FULLTEXT |SPATIAL )?KEY) `(\w+)` (.*)", l)
+            if not k is None: keys["{} {}".format(k.group(1), k.group(3))] = k.group(2)
+            f = re.match(r"CONSTRAINT `(\w+)` (FOREIGN KEY .*)", l)
+            if not f is None: foreign[f.group(2)] = f.group(1)
+        return (columns, primary, keys, foreign)
+    
+    def __alters(self, table, have, want):
+        columnsHave, primaryHave, keysHave, foreignHave = have
+        columnsWant, primaryWant, keysWant, foreignWant = want
+        changes, previous = ([], None)
+        for (c, l) in columnsWant.items():
+            place = " first" if previous is None else " after `{}`".format(previous)
+            if not c in columnsHave: 
+                changes.append("add column {}{}".format(l, place))
+            elif columnsHave[c] != l: 
+                changes.append("modify column {}".format(l))
+            previous = c
+        changes += ["drop column `{}`".format(c) for c in columnsHave if not c in columnsWant]
+        if primaryHave != primaryWant:
+            if not primaryHave is None: changes.append("drop primary key")
+            if not primaryWant is None: changes.append("add " + primaryWant)
+        changes += ["drop index `{}`".format(n) for (k, n) in keysHave.items() if not k in keysWant]
+        changes += ["add " + k for k in keysWant if not k in keysHave]
+        drops = ["drop foreign key `{}`".format(n) for (f, n) in foreignHave.items() if not f in foreignWant]
+        adds = ["add " + f for f in foreignWant if not f in foreignHave]
+        return ["alter table {} {}".format(table, ", ".join(a)) for a in (drops, changes, adds) if len(a) > 0]
+        
     def createAndAddToManageColumns(self, table, code, foreign_checks, index):
         index = self.createTable(table, code, False, foreign_checks, index)
         self.addTableToManageColumns(table, code.column_count)
         return index
         
     def addTableToManageColumns(self, table, column_count):
-        if not self.isMaintained:
+        if self.isMigrating:
+            self.db.modify("delete from manage_columns where table_name = '{}'".format(table))
+        if not self.isMaintained or self.isMigrating:
             self.db.modify("insert into manage_columns values ('{}', '{}')".format(table, ",".join(["?"] * column_count)))
         return self
         
     def manageTable(self, table, column_count, index):
         manage = "manage_{}".format(table)
-        q = "drop table if exists {}".format(manage)
-        self.db.cursor.execute(q)
         q = WriteSql().setDefault(0).setNull(False)
-        q.setColumns("int", "new_id", "size")
-        q.setKeys("index", "new_id", "size")
+        if self.isAutoIncrement():
+            q.setColumns("int", "slot", "new_id", "size")
+            q.setKeys("primary", "slot")
+        else:
+            q.setColumns("int", "new_id", "size")
+            q.setKeys("index", "new_id", "size")
         q.separator = ",\n\t"
         q = "create table {} (\n\t{}\n) engine = INNODB".format(manage, q)
-        self.printResults(q, index)
-        self.db.cursor.execute(q)
-        if self.isMaintained:
+        new = self.__sendTable(manage, q, index)
+        if self.isMaintained and not self.isMigrating:
             self.__maintainTable(manage)
         else:
-            self.db.modify("insert into {} values ()".format(manage))
+            if new: self.db.modify("insert into {} values ()".format(manage))
             self.addTableToManageColumns(table, column_count)
         return index + 1
     
     def createTable(self, table, code, manage, foreign_checks, index):
-        q = "drop table if exists {}".format(table)
-        self.db.cursor.execute(q)
+        if manage and self.isAutoIncrement(): code.setAutoIncrement("{}_id".format(table))
         if foreign_checks: self.db.setForeignKeyChecks(0)
         code.separator = ",\n\t"
         q = "create table {} (\n\t{}\n) engine = INNODB".format(table, code)
-        self.printResults(q, index)
-        self.db.cursor.execute(q)
-        if self.isMaintained:
+        self.__sendTable(table, q, index)
+        if self.isMaintained and not self.isMigrating:
             self.__maintainTable(table)
         if foreign_checks: self.db.setForeignKeyChecks(1)
         if manage: index = self.manageTable(table, code.column_count, index+1)
         return index
     
+    def migrateIdStrategy(self, *tables):
+        '''Moves managed tables of an existing database to the auto_increment id strategy. Each id 
+           column becomes auto_increment starting after manage_<table>.new_id and manage_<table> gets 
+           its slot rows, keeping the size. Run TriggerSql with the same strategy afterwards, since the 
+           old triggers and functions still use the shared row.'''
+        self.setIdStrategy(self.AUTO_INCREMENT_IDS, self.idSlots)
+        self.db.setForeignKeyChecks(0)
+        try:
+            for table in tables:
+                manage = "manage_{}".format(table)
+                self.db.cursor.execute("drop trigger if exists before_insert_{}".format(table))
+                self.db.cursor.execute("select max(new_id), sum(size) from {}".format(manage))
+                (newId, size) = self.db.cursor.fetchall()[0]
+                self.db.cursor.execute("alter table {0} modify {0}_id int not null auto_increment, auto_increment = {1}".format(table, int(newId or 0) + 1))
+                self.db.cursor.execute("show columns from {} like 'slot'".format(manage))
+                if len(self.db.cursor.fetchall()) == 0:
+                    self.db.cursor.execute("alter table {} drop index new_id, add slot int not null default 0 first, add primary key (slot)".format(manage))
+                self.db.cursor.execute("delete from {}".format(manage))
+                self.db.cursor.execute("insert into {} (slot, new_id, size) values (0, %s, %s)".format(manage), (int(newId or 0), int(size or 0)))
+                self.db.db.commit()
+        finally:
+            self.db.setForeignKeyChecks(1)
+        return self
+    
     def begin_table(self, table):
         table_id = "{}_id".format(table)
         code = WriteSql()
@@ -666,6 +2422,30 @@ class GetSql(ExecuteSql):
             code = "return (select {} from {} where {}_id = g);".format(column, table, whereTable)
         return self.createFunction(name, "g int", returnType, code, index)
     
+class ViewSql(ExecuteSql):
+    '''Views that read with joins what the get functions of GetSql read one row at a time, 
+       which the optimizer can't merge into the query calling them.'''
+    def __init__(self, db = None, printText = True, debug = False, execute = ExecuteSql):
+        execute.__init__(self, "views", db, printText, debug)
+        
+    def __columns(self, table):
+        self.db.cursor.execute("select column_name from information_schema.columns where table_schema = %s and table_name = %s order by ordinal_position", (self.db.db_name, table))
+        return [c[0] for c in self.db.cursor.fetchall()]
+        
+    def fullView(self, table, index, *tables, columns = (), joins = ()):
+        '''Creates <table>_full, the rows of table left joined to the rows of tables with the same 
+           <table>_id, which is their primary key, so every join is a primary key lookup.
+           columns - More select expressions, such as a name put together from other columns.
+           joins - More join clauses for those columns.'''
+        key = "{}_id".format(table)
+        select = ["{}.*".format(table)]
+        for t in tables:
+            select += ["{}.{}".format(t, c) for c in self.__columns(t) if c != key]
+        select += columns
+        joins = ["left join {0} on {0}.{1} = {2}.{1}".format(t, key, table) for t in tables] + list(joins)
+        q = "select {} from {} {}".format(", ".join(select), table, " ".join(joins)).strip()
+        return self.createView("{}_full".format(table), q, index)
+    
 class TriggerSql(ExecuteSql):
     def __init__(self, db = None, printText = True, debug = False, execute = ExecuteSql):
         execute.__init__(self, "triggers", db, printText, debug)
@@ -678,29 +2458,53 @@ class TriggerSql(ExecuteSql):
         
     def manageId(self, table, index):
         m = "manage_{}".format(table)
-        code = "return (select new_id from {});".format(m)
+        if self.isAutoIncrement():
+            code = "return ifnull(@{}_id, 0);".format(m)
+        else:
+            code = "return (select new_id from {});".format(m)
         return self.createFunction("{}_id".format(m), "", "int", code, index)
          
     def manageSize(self, table, index):
         m = "manage_{}".format(table)
-        code = "return (select size from {});".format(m)
+        if self.isAutoIncrement():
+            code = "return (select ifnull(sum(size), 0) from {});".format(m)
+        else:
+            code = "return (select size from {});".format(m)
         return self.createFunction("{}_size".format(m), "", "int", code, index)
+    
+    def reserveIds(self, table, index):
+        '''Creates reserve_<table>_ids(n, first_id, last_id), which takes n ids from manage_<table> in one 
+           update and adds them to the size. The insert trigger keeps an id that is already reserved, 
+           so rows inserted with them don't touch manage_<table> again.'''
+        m = "manage_{}".format(table)
+        code = WriteSql()
+        code.append("update {} set new_id = last_insert_id(new_id + n), size = size + n".format(m))
+        code.append("set last_id = last_insert_id()")
+        code.append("set first_id = last_id - n + 1;")
+        args = "in n int, out first_id int, out last_id int"
+        return self.createProcedure("reserve_{}_ids".format(table), args, code, index)
+    
+    def __slotSize(self, table, change):
+        '''Adds change to the size row of this connection's slot, so writers on other connections 
+           mostly update other rows.'''
+        return "insert into manage_{0} (slot, size) values (connection_id() % {1}, {2}) on duplicate key update size = size + {2}".format(table, self.idSlots, change)
      
     def createTrigger(self, name, action, table, code, index):
-        self.db.cursor.execute("drop trigger if exists {}".format(name))
         q = WriteSql()
         q.append("create trigger {} {} on {} for each row".format(name, action, table))
         q = self.begin_method(q, code)
-        self.printResults(q, index)
-        self.db.cursor.execute(q)
-        return index + 1
+        return self.sendCreate("trigger", name, q, index)
          
     def manageTrigger(self, table, code, index, *codeAfter):
         for m in (self.manageId, self.manageSize):
             index = m(table, index)
+        if self.isAutoIncrement():
+            return self.__autoIncrementTrigger(table, code, index, *codeAfter)
+        index = self.reserveIds(table, index)
         m = "manage_{}".format(table)
-        code.append("update {0} set new_id = {0}_id() + 1, size = {0}_size() + 1".format(m))
-        code.append("set new.{}_id = {}_id()".format(table, m))
+        t = "new.{}_id".format(table)
+        code.append("if {1} < 1 or {1} > {0}_id() then \n\t\t\tupdate {0} set new_id = {0}_id() + 1, size = {0}_size() + 1;".format(m, t) +
+                    "\n\t\t\tset {} = {}_id();\n\t\tend if".format(t, m))
         if len(codeAfter) > 0:
             for a in codeAfter:
                 code.append(a)
@@ -710,10 +2514,26 @@ class TriggerSql(ExecuteSql):
         name = "{}_{}".format(action.replace(" ", "_"), table)          
         return self.createTrigger(name, action, table, code, index)
     
+    def __autoIncrementTrigger(self, table, code, index, *codeAfter):
+        for a in codeAfter:
+            code.append(a)
+        code.separator = ";\n\t\t"
+        if len(code.code) > 0:
+            code.code[-1] = code.code[-1] + ";"
+            index = self.createTrigger("before_insert_{}".format(table), "before insert", table, code, index)
+        after = WriteSql()
+        after.append("set @manage_{0}_id = new.{0}_id".format(table))
+        after.append(self.__slotSize(table, 1) + ";")
+        after.separator = ";\n\t\t"
+        return self.createTrigger("after_insert_{}".format(table), "after insert", table, after, index)
+    
     def deleteTrigger(self, index, *tables):
         if len(tables) > 0:
             for t in tables:
-                code = "update {0} set {1} = {0}_{1}() - 1;".format("manage_{}".format(t), "size")
+                if self.isAutoIncrement():
+                    code = self.__slotSize(t, -1) + ";"
+                else:
+                    code = "update {0} set {1} = {0}_{1}() - 1;".format("manage_{}".format(t), "size")
                 index = self.createTrigger("delete_{}".format(t), "before delete", t, code, index)
         return index
     
@@ -763,7 +2583,7 @@ class PreparedInsertStatements(ExecuteSql):
         return self.createPreparedStatement("insert_"+name, args, prepStatement, setStatements, index)
         
     def addTableId(self, table):
-        self.db.setArgs(table).query("select table_name from manage_columns where table_name = %s", printText=self.printText, debug = self.debug)
+        self.db.setArgs(table).query("select table_name from manage_columns where table_name = %s", printText=self.printText, debug = self.debug, mode = PySql.RECORD_RESULTS)
         results = self.db.results[2][0]
         if len(results) > 0:
             table = "{}_id".format(results["table_name"])
@@ -883,6 +2703,43 @@ class PreparedDeleteStatements(ExecuteSql):
         setStatements = {"table_id":"table_id"}
         return self.createPreparedStatement("delete_table_id", args, prepStatement, setStatements, i)
     
+class StaticStatements(ExecuteSql):
+    '''Creates one typed procedure per table and statement from the columns the table has when the 
+       schema is built, so calls don't concat, prepare and deallocate a statement or read manage_columns.'''
+    def __init__(self, db = None, printText = True, debug = False, execute = ExecuteSql):
+        execute.__init__(self, "static statements", db, printText, debug)
+        
+    def __columns(self, table):
+        q = "select column_name, column_type from information_schema.columns where table_schema = %s and table_name = %s order by ordinal_position"
+        self.db.cursor.execute(q, (self.db.db_name, table))
+        return self.db.cursor.fetchall()
+        
+    def insertProcedure(self, table, index):
+        '''insert_<table> with an in parameter for every column, the id included.'''
+        columns = self.__columns(table)
+        args = ", ".join("in v_{} {}".format(c, t) for (c, t) in columns)
+        code = "insert into {} ({}) values ({});".format(table, ", ".join(c for (c, _) in columns), ", ".join("v_{}".format(c) for (c, _) in columns))
+        return self.createProcedure("insert_{}".format(table), args, code, index)
+    
+    def updateProcedure(self, table, column, index, where = None):
+        '''set_<table>_<column>, which sets column for every row, or for the rows where the where 
+           column equals its second parameter. That one is called set_<table>_<column>_where_<where>.'''
+        types = dict(self.__columns(table))
+        args = "in v_{} {}".format(column, types[column])
+        code = "update {0} set {1} = v_{1}".format(table, column)
+        name = "set_{}_{}".format(table, column)
+        if not where is None:
+            args += ", in w_{} {}".format(where, types[where])
+            code += " where {0} = w_{0}".format(where)
+            name += "_where_{}".format(where)
+        return self.createProcedure(name, args, code + ";", index)
+    
+    def execute(self, i=1):
+        self.db.query("select table_name from manage_columns", printText = False, debug = False, mode = PySql.TUPLE_RESULTS)
+        for (table,) in self.db.results[2]:
+            i = self.insertProcedure(table, i)
+        return i
+    
 class AddSql(ExecuteSql):
     def __init__(self, db = None, printText = True, debug = False, execute = ExecuteSql):
         execute.__init__(self, "adds", db, printText, debug)